@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following script benchmarks the van der Waals clash check on the bundled ligands
+########################################################################################################################
+# python clash-check-benchmark.py [--conformers 200] [--noise 0.1] [--seed 0]
+#
+# For every mol2 file in molecular-unfolding-data, random conformers are made by
+# moving the atoms of the ligand, then checked with
+#   pair-loop  the per atom pair loop of ResultParser before the cell list
+#   cell-list  ClashChecker.check on one conformer at a time
+#   batch      ClashChecker.check_batch on all conformers at once
+# The pass/fail results of the three must agree.
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(__dir__, "..", "hybridjobs"))
+
+from utility.MoleculeParser import MoleculeData
+from utility.MolGeoCalc import calc_distance_between_pts
+from utility.ClashCheck import ClashChecker
+
+logging.disable(logging.INFO)
+
+
+def non_contact_atom(mol_data):
+    mol_graph = mol_data.bond_graph.mol_ug
+    non_contact_atom_map = {}
+    for node_main in mol_graph.nodes:
+        non_contact_atom_map[node_main] = [node_candidate for node_candidate in mol_graph.nodes
+                                           if node_candidate != node_main and node_candidate not in mol_graph.neighbors(node_main)]
+    return non_contact_atom_map
+
+
+def pair_loop_check(mol_data, non_contact_atom_map, atom_name, pts):
+    # reference implementation, same loops as the original physical check
+    atom_pos = dict(zip(atom_name, pts.tolist()))
+    for atom_index in atom_name:
+        vdw_radius = mol_data.atom_data[atom_index]['vdw-radius']
+        for non_contact_atom in non_contact_atom_map[atom_index]:
+            distance = calc_distance_between_pts(
+                [atom_pos[atom_index]], [atom_pos[non_contact_atom]])
+            if distance < vdw_radius:
+                return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conformers", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data_dir = os.path.join(__dir__, "..", "molecular-unfolding-data")
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'file':<36}{'atoms':>6}{'pass':>6}{'pair-loop s':>13}{'cell-list s':>13}{'batch s':>10}{'speedup':>9}")
+    for mol_file in sorted(glob.glob(os.path.join(data_dir, "*.mol2"))):
+        mol_data = MoleculeData(mol_file, 'qmu')
+        checker = ClashChecker.from_mol_data(mol_data)
+        raw_pts = checker.pts_array(
+            {pt: {'pts': [info['x'], info['y'], info['z']]} for pt, info in mol_data.atom_data.items()})
+        pts_batch = raw_pts[np.newaxis, :, :] + \
+            rng.normal(scale=args.noise, size=(args.conformers,) + raw_pts.shape)
+
+        start = time.time()
+        non_contact_atom_map = non_contact_atom(mol_data)
+        loop_result = [pair_loop_check(mol_data, non_contact_atom_map, checker.atom_name, pts)
+                       for pts in pts_batch]
+        loop_time = time.time() - start
+
+        start = time.time()
+        checker = ClashChecker.from_mol_data(mol_data)
+        cell_result = [checker.check(pts) for pts in pts_batch]
+        cell_time = time.time() - start
+
+        start = time.time()
+        batch_result = (checker.check_batch(pts_batch) == 0).tolist()
+        batch_time = time.time() - start
+
+        if not loop_result == cell_result == batch_result:
+            raise Exception(f"clash check results differ for {mol_file}")
+
+        print(f"{os.path.basename(mol_file):<36}{checker.num_atoms:>6}{sum(cell_result):>6}"
+              f"{loop_time:>13.4f}{cell_time:>13.4f}{batch_time:>10.4f}{loop_time/batch_time:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
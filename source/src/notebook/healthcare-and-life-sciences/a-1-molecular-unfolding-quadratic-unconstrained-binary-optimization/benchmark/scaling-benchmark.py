@@ -0,0 +1,206 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following script benchmarks how the molecular unfolding pipeline scales with M and D
+########################################################################################################################
+# python scaling-benchmark.py [--rb 2 4 6 8] [--M ...] [--D 2 4 8] [--shots 100] [--timeout 600] [--out scaling.csv]
+#
+# For every number of rotatable bonds a synthetic, folded chain ligand is generated, and
+# MoleculeData -> QMUQUBO (pre-calc) -> Annealer (neal-sa) -> ResultParser runs
+# offline for every M (default: M = rotatable bonds) and D. Every configuration runs in its
+# own process, so the peak RSS is per configuration and a configuration past
+# --timeout is stopped. The table is written as csv, one row per configuration.
+
+import argparse
+import csv
+import json
+import os
+import resource
+import shutil
+import subprocess  # nosec
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(__dir__, "..", "hybridjobs"))
+
+COLUMNS = ["rb", "M", "D", "status", "atoms", "variables", "interactions",
+           "parse_s", "build_s", "sample_s", "post_s", "total_s", "peak_rss_mb", "gain"]
+
+# sp3 carbon chain, 1.54 A bonds and 109.5 degree angles. Every torsion is
+# gauche (60 degrees), so the chain starts folded and unfolding it to the
+# all-trans zig-zag increases the ris distance
+BOND_LENGTH = 1.54
+BOND_ANGLE = 109.5
+TORSION = 60.0
+
+
+def _place_atom(a, b, c, length, angle, torsion):
+    # position of d bonded to c, with angle b-c-d and torsion a-b-c-d in degrees
+    angle, torsion = np.radians(angle), np.radians(torsion)
+    bc = (c - b) / np.linalg.norm(c - b)
+    n = np.cross(b - a, bc)
+    n = n / np.linalg.norm(n)
+    m = np.cross(n, bc)
+    d = np.array([-length*np.cos(angle),
+                  length*np.sin(angle)*np.cos(torsion),
+                  length*np.sin(angle)*np.sin(torsion)])
+    return c + d[0]*bc + d[1]*m + d[2]*n
+
+
+def chain_ligand_mol2(num_rb, path):
+    # n-alkane with num_rb+3 carbons, every bond except the two terminal ones
+    # is rotatable
+    num_atoms = num_rb + 3
+    lines = ["@<TRIPOS>MOLECULE", f"chain_{num_rb}",
+             f"{num_atoms:>5d} {num_atoms-1:>5d}     0     0     0", "SMALL", "NO_CHARGES", "",
+             "@<TRIPOS>ATOM"]
+    half = np.radians(BOND_ANGLE) / 2
+    pts = [np.array([0.0, 0.0, 0.0]),
+           np.array([BOND_LENGTH*np.sin(half), BOND_LENGTH*np.cos(half), 0.0]),
+           np.array([2*BOND_LENGTH*np.sin(half), 0.0, 0.0])]
+    while len(pts) < num_atoms:
+        pts.append(_place_atom(pts[-3], pts[-2], pts[-1],
+                               BOND_LENGTH, BOND_ANGLE, TORSION))
+    for idx in range(num_atoms):
+        x, y, z = pts[idx]
+        lines.append(
+            f"{idx+1:>7d} C{idx+1:<7d}{x:>10.4f}{y:>10.4f}{z:>10.4f} C.3       1 chain_{num_rb}      0.0000")
+    lines.append("@<TRIPOS>BOND")
+    for idx in range(num_atoms-1):
+        lines.append(f"{idx+1:>6d} {idx+1:>5d} {idx+2:>5d} 1")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def qubo_size(qubo):
+    if hasattr(qubo, "num_interactions"):
+        return qubo.num_variables, qubo.num_interactions
+    variables = set()
+    interactions = 0
+    for (u, v), bias in qubo.items():
+        variables.add(u)
+        variables.add(v)
+        if u != v and bias != 0:
+            interactions = interactions + 1
+    return len(variables), interactions
+
+
+def run_config(num_rb, M, D, shots, qubo_format, work_dir):
+    # one pipeline run, in the current process
+    row = {"rb": num_rb, "M": M, "D": D}
+    os.chdir(work_dir)
+    try:
+        _run_pipeline(row, work_dir, shots, qubo_format)
+    finally:
+        os.chdir(__dir__)
+    return row
+
+
+def _run_pipeline(row, work_dir, shots, qubo_format):
+    import logging
+    logging.disable(logging.INFO)
+    from utility.MoleculeParser import MoleculeData
+    from utility.QMUQUBO import QMUQUBO
+    from utility.AnnealerOptimizer import Annealer
+    from utility.ResultProcess import ResultParser
+
+    num_rb, M, D = row["rb"], row["M"], row["D"]
+    raw_path = chain_ligand_mol2(
+        num_rb, os.path.join(work_dir, f"chain_{num_rb}.mol2"))
+
+    start = time.time()
+    mol_data = MoleculeData(raw_path, 'qmu')
+    data_path = mol_data.save("latest")
+    row["atoms"] = len(mol_data.atom_data)
+    row["parse_s"] = time.time() - start
+    if mol_data.bond_graph.rb_num < M:
+        raise Exception(
+            f"only {mol_data.bond_graph.rb_num} rotatable bonds for M={M}")
+
+    start = time.time()
+    qmu_qubo = QMUQUBO(mol_data, ['pre-calc'], **
+                       {'pre-calc': {'param': ['M', 'D', 'A', 'hubo_qubo_val']}})
+    qmu_qubo.build_model(**{'pre-calc': {'M': [M], 'D': [D], 'A': [300], 'hubo_qubo_val': [200],
+                                         'workers': 1, 'qubo_format': qubo_format}})
+    model = qmu_qubo.get_model('pre-calc', f"{M}_{D}_300_200")
+    row["build_s"] = time.time() - start
+    row["variables"], row["interactions"] = qubo_size(model["qubo"])
+
+    start = time.time()
+    Annealer(model, 'neal-sa', shots=shots).fit()
+    row["sample_s"] = time.time() - start
+
+    start = time.time()
+    result_parser = ResultParser('neal-sa', raw_path=raw_path, data_path=data_path)
+    result_parser.generate_optimize_pts()
+    row["post_s"] = time.time() - start
+    row["gain"] = result_parser.parameters["volume"]["gain"]
+
+    row["total_s"] = row["parse_s"] + row["build_s"] + \
+        row["sample_s"] + row["post_s"]
+    # ru_maxrss is in KB on linux
+    row["peak_rss_mb"] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss / 1024
+    row["status"] = "ok"
+
+
+def _run_subprocess(num_rb, M, D, args):
+    # the work dir is removed here, a stopped configuration can not clean up
+    row = {"rb": num_rb, "M": M, "D": D}
+    work_dir = tempfile.mkdtemp(prefix=f"qmu_scaling_{num_rb}_{M}_{D}_")
+    command = [sys.executable, os.path.abspath(__file__), "--run", str(num_rb), str(M), str(D),
+               "--shots", str(args.shots), "--qubo-format", args.qubo_format, "--work-dir", work_dir]
+    try:
+        result = subprocess.run(command, capture_output=True,  # nosec
+                                text=True, timeout=args.timeout)
+        if result.returncode == 0:
+            row = json.loads(result.stdout.strip().splitlines()[-1])
+        else:
+            row["status"] = "error: " + result.stderr.strip().splitlines()[-1]
+    except subprocess.TimeoutExpired:
+        row["status"] = f"timeout {args.timeout} s"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rb", type=int, nargs="+", default=[2, 4, 6, 8])
+    parser.add_argument("--M", type=int, nargs="+", default=None)
+    parser.add_argument("--D", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--shots", type=int, default=100)
+    parser.add_argument("--qubo-format", default="dict")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--out", default=None)
+    # internal: run one configuration and print its row as json
+    parser.add_argument("--run", type=int, nargs=3, default=None)
+    parser.add_argument("--work-dir", default=None)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        num_rb, M, D = args.run
+        print(json.dumps(run_config(num_rb, M, D, args.shots, args.qubo_format, args.work_dir)))
+        return
+
+    out = open(args.out, "w", newline="") if args.out else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for num_rb in args.rb:
+        M_list = [M for M in args.M if M <= num_rb] if args.M else [num_rb]
+        for M in M_list:
+            for D in args.D:
+                writer.writerow(_run_subprocess(num_rb, M, D, args))
+                out.flush()
+    if args.out:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,6 @@
 
 
 import logging
-import boto3
 import json
 import os
 import sys
@@ -15,23 +14,23 @@ import sys
 __dir__ = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(__dir__)
 
-from utility.MoleculeParser import MoleculeData
+from utility.MoleculeParser import MoleculeData, read_mol2_records, mol2_record_name
 from utility.QMUQUBO import QMUQUBO
 from utility.AnnealerOptimizer import Annealer
 from utility.ResultProcess import ResultParser
 
-from braket.aws import AwsDevice
-from braket.jobs import save_job_result
-from braket.jobs.metrics import log_metric
-from braket.tracking import Tracker
-
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
                     datefmt='%Y-%m-%d:%H:%M:%S',
                     level=logging.INFO)
 
 def main():
+    # braket is only needed once the job runs, importing this script stays cheap
+    from braket.jobs import save_job_result
+    from braket.tracking import Tracker
+
     t = Tracker().start()
     
     input_dir = os.environ["AMZN_BRAKET_INPUT_DIR"]
@@ -51,6 +50,14 @@ def main():
     dir_name = f"{input_dir}/input/"
     dir_list = os.listdir(dir_name)
 
+    batch_workers = int(hyperparameters.get('batch_workers', 1))
+    if batch_workers > 1:
+        # run the molecules concurrently and save all results at once
+        result = _run_batch(dir_name, dir_list, hyperparameters, batch_workers)
+        save_job_result(result)
+        logging.info("Saved results. All done.")
+        return
+
     for file_name in dir_list:
         # step 1: prepare data
         raw_path = dir_name + file_name
@@ -66,8 +73,63 @@ def main():
 
     logging.info("Saved results. All done.")
 
-def _prepare_data(raw_path, hyperparameters):
-    mol_data = MoleculeData(raw_path, 'qmu')
+def _run_batch(dir_name, dir_list, hyperparameters, batch_workers):
+    # one task per molecule, a multi-molecule mol2 file gives one task per
+    # record. Only the parsed record is sent, the worker builds the MoleculeData
+    # (bond graph) itself. Each task runs in its own scratch directory, because
+    # the model and the optimize result are saved with fixed names in the working directory
+    scratch_dir = os.path.join(os.getcwd(), "batch")
+    # the molecules already share the cores, build each model in one process
+    molecule_hyperparameters = dict(hyperparameters)
+    molecule_hyperparameters['workers'] = 1
+
+    futures = {}
+    with ProcessPoolExecutor(max_workers=batch_workers) as executor:
+        for file_name in dir_list:
+            raw_path = os.path.abspath(dir_name + file_name)
+            for idx, record in enumerate(read_mol2_records(raw_path)):
+                name = mol2_record_name(raw_path, idx, record)
+                # the submit index keeps the directories of a.mol2 and a.v2.mol2 apart
+                work_dir = os.path.join(
+                    scratch_dir, f"{len(futures)}_{name}")
+                futures[f"{file_name}/{name}"] = executor.submit(
+                    _run_molecule, record, name, work_dir, molecule_hyperparameters)
+
+        logging.info(f"Batch mode: {len(futures)} molecules with {batch_workers} workers")
+
+        result = {}
+        for mol_name, future in futures.items():
+            try:
+                result[mol_name] = future.result()
+            except Exception as e:
+                logging.error(f"Molecule {mol_name} failed: {e}")
+                result[mol_name] = {"error": str(e)}
+
+    return result
+
+def _run_molecule(record, name, work_dir, hyperparameters):
+    # the record is written as a single molecule mol2 file in work_dir, so the
+    # result mol2/json files of ResultParser are written next to it as well
+    from utility.ConformerWriter import write_conformers
+
+    os.makedirs(work_dir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        raw_path = write_conformers(os.path.join(work_dir, f"{name}.mol2"), record,
+                                    record['pts'], titles=[record['name'] or name])
+        data_path, mol_data = _prepare_data(
+            raw_path, hyperparameters, name=name, record=record)
+        model_path = _build_model(data_path, mol_data, hyperparameters)
+        _optimize(model_path, hyperparameters)
+        result = _post_process(raw_path, data_path, hyperparameters)
+    finally:
+        os.chdir(cwd)
+    return result
+
+def _prepare_data(raw_path, hyperparameters, name=None, record=None):
+    # record: the already parsed read_mol2_records item of raw_path, if any
+    mol_data = MoleculeData(raw_path, 'qmu', name=name, record=record)
     
     data_path = mol_data.save("latest")
     
@@ -102,6 +164,8 @@ def _build_model(data_path, mol_data, hyperparameters):
     model_param[method]['D'] = [int(hyperparameters['D'])]
     model_param[method]['A'] = [300]
     model_param[method]['hubo_qubo_val'] = [200]
+    model_param[method]['distance'] = hyperparameters.get('distance', 'atom')
+    model_param[method]['workers'] = int(hyperparameters.get('workers', os.cpu_count()))
 
     qmu_qubo.build_model(**model_param)
     # describe the model parameters
@@ -128,6 +192,8 @@ def _optimize(model_path, hyperparameters):
 
     optimizer_param = {}
     optimizer_param['shots'] = int(hyperparameters['shots'])
+    # the post process below reads the memory-mapped arrays, only the top rows are unpacked
+    optimizer_param['result_format'] = hyperparameters.get('result_format', 'array')
 
     sa_optimizer = Annealer(qubo_model, method, **optimizer_param)
 
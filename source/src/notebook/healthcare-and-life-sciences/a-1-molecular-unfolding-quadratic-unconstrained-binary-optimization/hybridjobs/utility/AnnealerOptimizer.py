@@ -6,19 +6,31 @@
 ########################################################################################################################
 from posixpath import basename
 import dimod
-import neal
-from dwave.system.composites import EmbeddingComposite
-from braket.ocean_plugin import BraketDWaveSampler
-from braket.ocean_plugin import BraketSampler
 
 import time
 import pickle  # nosec
 import os
 import logging
 import json
-import boto3
+import numpy as np
+
+from .SparseQUBO import SparseQUBO
+from .EmbeddingCache import EmbeddingCache
+from .ResultStore import save_result_arrays
+from .NumpySampler import NumpySimulatedAnnealingSampler, NumpyParallelTemperingSampler
+from .LazyModel import LazyDistanceModel
+
+# created on first use, importing this module needs no AWS region or credentials
+s3_client = None
+
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client("s3")
+    return s3_client
 
-s3_client = boto3.client("s3")
 
 log = logging.getLogger()
 log.setLevel('INFO')
@@ -53,13 +65,23 @@ class Annealer():
         elif method == "neal-sa":
             # https://github.com/dwavesystems/dwave-neal
             logging.info("use neal simulated annealer (c++) from dimod")
+            import neal
             self.sampler = neal.SimulatedAnnealingSampler()
+        elif method == "numpy-sa":
+            logging.info("use numpy simulated annealer with parallel reads")
+            self.sampler = NumpySimulatedAnnealingSampler(
+                workers=param.get("workers", 1))
+        elif method == "numpy-pt":
+            logging.info("use numpy parallel tempering (replica exchange)")
+            self.sampler = NumpyParallelTemperingSampler(workers=param.get("workers", 1), num_replicas=param.get(
+                "num_replicas", 16), swap_interval=param.get("swap_interval", 1))
         elif method == "dwave-qa":
             self.my_bucket = param["bucket"]  # the name of the bucket
             # the name of the folder in the bucket
             self.my_prefix = param["prefix"]
             s3_folder = (self.my_bucket, self.my_prefix)
             # async implementation
+            from braket.ocean_plugin import BraketSampler
             self.sampler = BraketSampler(s3_folder, param["device"])
             logging.info("use quantum annealer {} ".format(param["device"]))
 
@@ -73,23 +95,47 @@ class Annealer():
     def fit(self):
         logging.info("fit() ...")
         start = time.time()
-        if self.method == "dwave-sa" or self.method == "neal-sa":
+        if isinstance(self.qubo, LazyDistanceModel) and self.method != "dwave-qa":
+            # after-calc model has no qubo, use its own annealing loop
+            self.response = self.qubo.sample(num_reads=self.param["shots"], num_sweeps=self.param.get(
+                "num_sweeps", 100), seed=self.param.get("seed"))
+        elif self.method == "dwave-sa" or self.method == "neal-sa":
             # response = self.sampler.sample(
             #     self.qubo, num_reads=self.param["shots"]).aggregate()
-            self.response = self.sampler.sample_qubo(
-                self.qubo, num_reads=self.param["shots"])
+            if isinstance(self.qubo, SparseQUBO):
+                self.response = self.sampler.sample(
+                    self.qubo.to_bqm(), num_reads=self.param["shots"])
+            else:
+                self.response = self.sampler.sample_qubo(
+                    self.qubo, num_reads=self.param["shots"])
+        elif self.method == "numpy-sa":
+            self.response = self.sampler.sample(self.qubo, num_reads=self.param["shots"], num_sweeps=self.param.get(
+                "num_sweeps", 1000), seed=self.param.get("seed"))
+        elif self.method == "numpy-pt":
+            self.response = self.sampler.sample(self.qubo, num_reads=self.param["shots"], num_sweeps=self.param.get("num_sweeps", 1000), beta_range=self.param.get(
+                "beta_range"), betas=self.param.get("betas"), target_energy=self.param.get("target_energy"), seed=self.param.get("seed"))
         elif self.method == "dwave-qa":
+            if isinstance(self.qubo, LazyDistanceModel):
+                raise Exception(
+                    "after-calc model only supports simulated annealing methods !")
             # response = self.sampler.sample(
             #     self.qubo, num_reads=self.param["shots"]).aggregate()
             # actually it's quantum task
-            self.response = self.sampler.sample_qubo(
-                self.qubo, shots=self.param["shots"])
+            if isinstance(self.qubo, SparseQUBO):
+                self.response = self.sampler.sample(
+                    self.qubo.to_bqm(), shots=self.param["shots"])
+            else:
+                self.response = self.sampler.sample_qubo(
+                    self.qubo, shots=self.param["shots"])
         end = time.time()
         self.time["run-time"] = end-start
         result = {}
         result["response"] = self.response
         result["time"] = self.time["run-time"]
         result["model_info"] = self.model_info
+        if self.param.get("target_energy") is not None:
+            result["time_to_target"] = self._time_to_target(
+                self.param["target_energy"])
         self.result = result
 
 #         print(f"result={self.result}")
@@ -98,7 +144,11 @@ class Annealer():
         # upload data
         if self.method != "dwave-qa":
             logging.info(f"{self.method} save to local")
-            self.save(f"{self.method}_result.pickle")
+            # "pickle": ./{method}_result.pickle, "array": the memory-mapped ./{method}_result/ of ResultStore
+            if self.param.get("result_format", "pickle") == "pickle":
+                self.save(f"{self.method}_result.pickle")
+            else:
+                save_result_arrays(self.result, f"./{self.method}_result")
         elif self.method == "dwave-qa":
             task_id = self.get_task_id()
             self.save("/tmp/qa_result.pickle")  # nosec
@@ -107,12 +157,36 @@ class Annealer():
             logging.info(f"{self.method} save to s3 - {task_id}: {response}")
         return result
 
+    def _time_to_target(self, target_energy, confidence=0.99):
+        # time to reach target_energy with the given confidence, estimated from
+        # the success probability of one read: tts = t_read*ln(1-confidence)/ln(1-p)
+        if self.method == "dwave-qa":
+            return None
+        energies = np.repeat(self.response.record.energy,
+                             self.response.record.num_occurrences)
+        success = float(np.mean(energies <= target_energy + 1e-6))
+        read_time = self.time["run-time"] / len(energies)
+        if success == 0:
+            tts = float("inf")
+        elif success == 1:
+            tts = read_time
+        else:
+            tts = read_time * np.log(1-confidence) / np.log(1-success)
+        logging.info(
+            f"{self.method} success probability {success}, time to target {tts} s")
+        time_to_target = {}
+        time_to_target["target_energy"] = target_energy
+        time_to_target["success_probability"] = success
+        time_to_target["confidence"] = confidence
+        time_to_target["tts"] = tts
+        return time_to_target
+
     def _upload_result_json(self, task_id, file_name):
         base_file_name = basename(file_name)
         key = f"{self.my_prefix}/{task_id}/{base_file_name}"
         logging.info(
             f"_upload_result_json, bucket={self.my_bucket}, key={key}")
-        response = s3_client.upload_file(
+        response = get_s3_client().upload_file(
             file_name, Bucket=self.my_bucket, Key=key)
         return response
 
@@ -140,14 +214,23 @@ class Annealer():
         return save_path
 
     def embed(self):
+        from dwave.system.composites import EmbeddingComposite, FixedEmbeddingComposite
         start = time.time()
         if self.param["embed_method"] == "default":
             self.sampler = EmbeddingComposite(self.sampler)
+        elif self.param["embed_method"] == "cache":
+            # reuse the embedding of models with the same interaction graph
+            cache = EmbeddingCache(self.param.get(
+                "embed_cache_dir", "./embedding_cache"))
+            embedding, cache_hit = cache.find_embedding(
+                self.qubo, self.sampler)
+            self.time["embed_cache_hit"] = cache_hit
+            self.sampler = FixedEmbeddingComposite(self.sampler, embedding)
         end = time.time()
         self.time["embed"] = (end-start)/60
 
     def time_summary(self):
-        if self.method == "dwave-sa" or self.method == "neal-sa":
+        if self.method == "dwave-sa" or self.method == "neal-sa" or self.method == "numpy-sa" or self.method == "numpy-pt":
             self.time["time"] = self.time["optimize"]
         elif self.method == "dwave-qa":
             self.time["time"] = self.time["optimize"] + \
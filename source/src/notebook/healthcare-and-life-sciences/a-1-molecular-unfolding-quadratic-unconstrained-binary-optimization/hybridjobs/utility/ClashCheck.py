@@ -0,0 +1,112 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the cell list van der Waals clash checker for conformers
+########################################################################################################################
+import numpy as np
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+# offsets of the 13 neighbour cells that are visited from every cell, the
+# other 13 are visited from the opposite side, so every cell pair is seen once
+HALF_OFFSET = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                        if (dx, dy, dz) > (0, 0, 0)], dtype=np.int64)
+
+
+class ClashChecker():
+    # Two atoms that are not bonded clash when their distance is below the
+    # threshold of the pair. Atoms are hashed into cubic cells with the size of
+    # the largest threshold, so only atoms in the same or adjacent cells can
+    # clash and the check is O(N) instead of O(N^2) per conformer.
+    # The threshold of (i, j) is max(radius_i, radius_j), the same as testing
+    # the vdw-radius of every atom against all its non contact atoms.
+
+    def __init__(self, atom_name, radius, bond_list):
+        self.atom_name = list(atom_name)
+        self.num_atoms = len(self.atom_name)
+        self.radius = np.asarray(radius, dtype=float)
+        self.cell_size = max(float(self.radius.max()), 1e-6) if self.num_atoms > 0 else 1.0
+
+        atom_idx = {name: idx for idx, name in enumerate(self.atom_name)}
+        bonded = []
+        for u, v in bond_list:
+            i, j = atom_idx[u], atom_idx[v]
+            bonded.append(min(i, j)*self.num_atoms + max(i, j))
+        self.bonded_key = np.unique(np.array(bonded, dtype=np.int64))
+
+    @classmethod
+    def from_mol_data(cls, mol_data):
+        atom_name = list(mol_data.atom_data.keys())
+        radius = [mol_data.atom_data[pt]['vdw-radius'] for pt in atom_name]
+        return cls(atom_name, radius, mol_data.bond_graph.mol_ug.edges)
+
+    def pts_array(self, atom_pos_data):
+        return np.array([atom_pos_data[pt]['pts'] for pt in self.atom_name], dtype=float)
+
+    def candidate_pairs(self, pts_batch):
+        # (conformer, i, j) with i < j of the atoms in the same or adjacent cells,
+        # the conformer index is part of the cell key so a batch is hashed at once
+        num_conformers = pts_batch.shape[0]
+        pts = pts_batch.reshape(-1, 3)
+        conformer = np.repeat(np.arange(num_conformers), self.num_atoms)
+        atom = np.tile(np.arange(self.num_atoms), num_conformers)
+
+        cell = np.floor((pts - pts.min(axis=0)) / self.cell_size).astype(np.int64) + 1
+        dims = cell.max(axis=0) + 2
+
+        def _key(c):
+            return ((conformer*dims[0] + c[:, 0])*dims[1] + c[:, 1])*dims[2] + c[:, 2]
+
+        order = np.argsort(_key(cell), kind='stable')
+        sorted_key = _key(cell)[order]
+
+        pair_p = []
+        pair_q = []
+        for offset in [np.zeros(3, dtype=np.int64)] + list(HALF_OFFSET):
+            neighbour_key = _key(cell + offset)
+            start = np.searchsorted(sorted_key, neighbour_key, side='left')
+            end = np.searchsorted(sorted_key, neighbour_key, side='right')
+            count = end - start
+            pos = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            pair_p.append(np.repeat(np.arange(len(pts)), count))
+            pair_q.append(order[np.repeat(start, count) + pos])
+        pair_p = np.concatenate(pair_p)
+        pair_q = np.concatenate(pair_q)
+
+        keep = pair_p != pair_q
+        low = np.minimum(atom[pair_p], atom[pair_q])[keep]
+        high = np.maximum(atom[pair_p], atom[pair_q])[keep]
+        atom_key = low*self.num_atoms + high
+        pair_key = np.unique(conformer[pair_p[keep]]*self.num_atoms*self.num_atoms + atom_key)
+        pair_key = pair_key[~np.isin(pair_key % (self.num_atoms*self.num_atoms), self.bonded_key)]
+        atom_key = pair_key % (self.num_atoms*self.num_atoms)
+        return pair_key // (self.num_atoms*self.num_atoms), atom_key // self.num_atoms, atom_key % self.num_atoms
+
+    def clash_pairs(self, pts_batch):
+        # (conformer, i, j) of all the clashes in (num_conformers, num_atoms, 3)
+        pts_batch = np.asarray(pts_batch, dtype=float).reshape(-1, self.num_atoms, 3)
+        if self.num_atoms < 2 or len(pts_batch) == 0:
+            return tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+        pair_b, pair_i, pair_j = self.candidate_pairs(pts_batch)
+        distance = np.linalg.norm(
+            pts_batch[pair_b, pair_i] - pts_batch[pair_b, pair_j], axis=1)
+        clash = distance < np.maximum(self.radius[pair_i], self.radius[pair_j])
+        return pair_b[clash], pair_i[clash], pair_j[clash]
+
+    def check(self, pts):
+        # True if the conformer (num_atoms, 3) has no clash
+        _, pair_i, pair_j = self.clash_pairs(pts)
+        if len(pair_i) > 0:
+            logging.info(
+                f"fail at {self.atom_name[pair_i[0]]} to {self.atom_name[pair_j[0]]}")
+            return False
+        return True
+
+    def check_batch(self, pts_batch):
+        # number of clashes of every conformer in (num_conformers, num_atoms, 3)
+        pts_batch = np.asarray(pts_batch, dtype=float).reshape(-1, self.num_atoms, 3)
+        pair_b, _, _ = self.clash_pairs(pts_batch)
+        return np.bincount(pair_b, minlength=len(pts_batch))
@@ -0,0 +1,53 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the LRU cache of partially rotated conformers
+########################################################################################################################
+from collections import OrderedDict
+
+import numpy as np
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class ConformerCache():
+    # The coordinates after applying the torsions one by one only depend on the
+    # ordered torsion assignment applied so far. Every entry maps such a prefix,
+    # e.g. (ris, 'X_12_3', 'X_14_1'), to the (num_atoms, 3) coordinates after its
+    # last torsion, so candidates sharing a prefix start from the longest
+    # cached one instead of the original coordinates.
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.cache)
+
+    def get(self, key):
+        if key not in self.cache:
+            return None
+        self.cache.move_to_end(key)
+        return self.cache[key]
+
+    def put(self, key, pts):
+        self.cache[key] = np.array(pts, dtype=float)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def longest_prefix(self, key, min_length=1):
+        # (length, pts) of the longest cached prefix of key, (0, None) if no
+        # prefix of at least min_length is cached
+        for length in range(len(key), min_length-1, -1):
+            pts = self.get(tuple(key[:length]))
+            if pts is not None:
+                self.hits = self.hits + 1
+                return length, pts
+        self.misses = self.misses + 1
+        return 0, None
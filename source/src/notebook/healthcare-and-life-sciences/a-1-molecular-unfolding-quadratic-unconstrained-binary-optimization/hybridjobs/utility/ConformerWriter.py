@@ -0,0 +1,92 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following functions write many conformers of one molecule as a single mol2/sdf/xyz stream
+########################################################################################################################
+import numpy as np
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+# mol2 bond type -> sdf bond order, 8 is "any" for the other types
+SDF_BOND_ORDER = {'1': 1, '2': 2, '3': 3, 'ar': 4, 'am': 1}
+
+
+def _element(atom_type):
+    return atom_type.split('.')[0]
+
+
+def _mol2_block(record):
+    # the per atom text around the coordinates is formatted once for all conformers
+    header = record.get('header', [])
+    mol_type = header[2] if len(header) > 2 else 'SMALL'
+    charge_type = header[3] if len(header) > 3 else 'NO_CHARGES'
+    counts = f"{len(record['atom_id']):>5d} {len(record['bond_id']):>5d}     0     0     0\n{mol_type}\n{charge_type}\n\n"
+
+    atom_prefix = [f"{atom_id:>7d} {atom_name:<8s}" for atom_id, atom_name in zip(
+        record['atom_id'].tolist(), record['atom_name'])]
+    atom_suffix = [f" {atom_type:<8s}{subst_id:>3d} {subst_name:<12s}{charge:>10.4f}\n" for atom_type, subst_id, subst_name, charge in zip(
+        record['atom_type'], record['subst_id'].tolist(), record['subst_name'], record['charge'].tolist())]
+    bond = "".join(f"{bond_id:>6} {atom_1:>5d} {atom_2:>5d} {bond_type}\n" for bond_id, (atom_1, atom_2), bond_type in zip(
+        record['bond_id'], record['bond_atom'].tolist(), record['bond_type']))
+    return counts, atom_prefix, atom_suffix, bond
+
+
+def write_mol2_conformers(f, record, pts_batch, titles):
+    counts, atom_prefix, atom_suffix, bond = _mol2_block(record)
+    for title, pts in zip(titles, pts_batch):
+        f.write(f"@<TRIPOS>MOLECULE\n{title}\n{counts}@<TRIPOS>ATOM\n")
+        f.write("".join(prefix + f"{x:>10.4f}{y:>10.4f}{z:>10.4f}" + suffix for prefix, (x, y, z), suffix in zip(
+            atom_prefix, pts.tolist(), atom_suffix)))
+        f.write(f"@<TRIPOS>BOND\n{bond}")
+
+
+def write_sdf_conformers(f, record, pts_batch, titles):
+    # V2000 molfile blocks, sdf atoms are numbered by their position
+    atom_pos = {atom_id: idx+1 for idx,
+                atom_id in enumerate(record['atom_id'].tolist())}
+    counts = f"{len(record['atom_id']):>3d}{len(record['bond_id']):>3d}  0  0  0  0  0  0  0  0999 V2000\n"
+    atom_suffix = [f" {_element(atom_type):<3s} 0  0  0  0  0  0  0  0  0  0  0  0\n"
+                   for atom_type in record['atom_type']]
+    bond = "".join(f"{atom_pos[atom_1]:>3d}{atom_pos[atom_2]:>3d}{SDF_BOND_ORDER.get(bond_type, 8):>3d}  0\n"
+                   for (atom_1, atom_2), bond_type in zip(record['bond_atom'].tolist(), record['bond_type']))
+    for title, pts in zip(titles, pts_batch):
+        f.write(f"{title}\n  qmu             3D\n\n{counts}")
+        f.write("".join(f"{x:>10.4f}{y:>10.4f}{z:>10.4f}" + suffix for (x, y, z), suffix in zip(
+            pts.tolist(), atom_suffix)))
+        f.write(f"{bond}M  END\n$$$$\n")
+
+
+def write_xyz_conformers(f, record, pts_batch, titles):
+    element = [f"{_element(atom_type):<2s}" for atom_type in record['atom_type']]
+    for title, pts in zip(titles, pts_batch):
+        f.write(f"{len(element)}\n{title}\n")
+        f.write("".join(f"{symbol} {x:>12.6f} {y:>12.6f} {z:>12.6f}\n" for symbol, (x, y, z) in zip(
+            element, pts.tolist())))
+
+
+CONFORMER_WRITER = {'mol2': write_mol2_conformers,
+                    'sdf': write_sdf_conformers,
+                    'xyz': write_xyz_conformers}
+
+
+def write_conformers(path, record, pts_batch, titles=None, file_type=None):
+    # record: the read_mol2_records item of the molecule (MoleculeData.mol)
+    # pts_batch: (num_conformers, num_atoms, 3) in the atom order of record
+    # file_type: mol2, sdf or xyz, from the extension of path by default
+    if file_type is None:
+        file_type = path.split('.')[-1]
+    if file_type not in CONFORMER_WRITER:
+        raise Exception(
+            f"file type {file_type} not supported! only support {','.join(CONFORMER_WRITER.keys())}")
+    pts_batch = np.asarray(pts_batch, dtype=float).reshape(
+        -1, len(record['atom_id']), 3)
+    if titles is None:
+        titles = [f"{record['name']}_{idx}" for idx in range(len(pts_batch))]
+
+    with open(path, 'w') as f:
+        CONFORMER_WRITER[file_type](f, record, pts_batch, titles)
+    logging.info(f"finish write {len(pts_batch)} conformers to {path}")
+    return path
@@ -6,6 +6,7 @@
 ########################################################################################################################
 
 import networkx as nx
+import numpy as np
 import math
 
 import logging
@@ -32,8 +33,11 @@ class BuildMolGraph():
         self.rb_data, self.rb_data_list = self.build_rb_data()
         # test only N rb for graph model
         self.sort_ris_data = {}
+        # fragment membership masks are shared by all the M prefixes
+        rb_index = self.build_rb_index()
         for M_cnt, rb_data in enumerate(self.rb_data_list):
-            self.sort_ris_data[str(M_cnt+1)] = self.build_ris_data(rb_data)
+            self.sort_ris_data[str(M_cnt+1)] = self.build_ris_data(
+                rb_data, rb_index)
 
     def build_graph(self):
         def add_node(nodes_list, node):
@@ -94,18 +98,20 @@ class BuildMolGraph():
                     if pair_pts not in rb_data['pair_set']:
                         rb_data['pair_set'].add(pair_pts)
 
+        # components of the graph without each rb, computed in one pass
+        rb_fragments = self.build_rb_fragments()
+
         # add list to save invalid rb
         invalid_rb_list = []
         invalid_rb_name_list = []
         for rb in self.rb_list:
-            self.mol_ug.remove_edge(rb[0], rb[1])
             current_rb_name = "{}+{}".format(rb[0], rb[1])
             self.rb_name.append(current_rb_name)
         #     print(rb_name)
             if current_rb_name not in rb_data.keys():
                 rb_data[current_rb_name] = {}
                 i = 0
-                for pts in nx.connected_components(self.mol_ug):
+                for pts in rb_fragments[rb]:
                     #             print(pts)
                     update_pts = pts.copy()
                     clear_set(update_pts, rb)
@@ -120,7 +126,6 @@ class BuildMolGraph():
                     self.bc[rb[0]] + self.bc[rb[1]])/2
                 # update make pts pair set
         #         update_pts_pair(rb_data[rb_name])
-            self.mol_ug.add_edge(rb[0], rb[1])
 
         for invalid_rb, invalid_rb_name in zip(invalid_rb_list, invalid_rb_name_list):
             self.rb_list.remove(invalid_rb)
@@ -141,53 +146,171 @@ class BuildMolGraph():
 
         return rb_data, rb_data_list
 
-    def build_ris_data(self, rb_data):
+    def build_rb_fragments(self):
+        # same result as removing each rb and running nx.connected_components,
+        # but all rb share one bridge search: removing a bridge splits its
+        # component into the subtree below it in the bridge tree and the rest,
+        # removing any other edge leaves the components unchanged
+        node_order = {node: idx for idx, node in enumerate(self.mol_ug.nodes)}
+        components = list(nx.connected_components(self.mol_ug))
+        component_first = [min(node_order[pt] for pt in pts)
+                           for pts in components]
+        bridges = list(nx.bridges(self.mol_ug))
+
+        # 2-edge-connected components are the nodes of the bridge tree
+        ecc_graph = self.mol_ug.copy()
+        ecc_graph.remove_edges_from(bridges)
+        ecc_id = {}
+        ecc_atoms = []
+        for idx, pts in enumerate(nx.connected_components(ecc_graph)):
+            ecc_atoms.append(list(pts))
+            for pt in pts:
+                ecc_id[pt] = idx
+        bridge_tree = nx.Graph()
+        bridge_tree.add_nodes_from(range(len(ecc_atoms)))
+        bridge_tree.add_edges_from(
+            (ecc_id[bridge[0]], ecc_id[bridge[1]]) for bridge in bridges)
+
+        # dfs from the first atom of each component, the atoms of a subtree
+        # are a contiguous slice of atom_list
+        atom_list = []
+        parent = {}
+        start = {}
+        end = {}
+        component_id = {}
+        for comp_idx, pts in enumerate(components):
+            root = ecc_id[min(pts, key=node_order.get)]
+            stack = [(root, None, False)]
+            while len(stack) > 0:
+                node, parent_node, visited = stack.pop()
+                if visited:
+                    end[node] = len(atom_list)
+                    continue
+                parent[node] = parent_node
+                start[node] = len(atom_list)
+                component_id[node] = comp_idx
+                atom_list.extend(ecc_atoms[node])
+                stack.append((node, parent_node, True))
+                for child in bridge_tree.neighbors(node):
+                    if child != parent_node:
+                        stack.append((child, node, False))
+
+        bridge_set = set(bridges) | set((bridge[1], bridge[0])
+                                        for bridge in bridges)
+        rb_fragments = {}
+        for rb in self.rb_list:
+            if rb not in bridge_set:
+                rb_fragments[rb] = components
+                continue
+            ecc_0 = ecc_id[rb[0]]
+            ecc_1 = ecc_id[rb[1]]
+            child = ecc_0 if parent[ecc_0] == ecc_1 else ecc_1
+            sub_pts = set(atom_list[start[child]:end[child]])
+            comp_idx = component_id[child]
+            fragments = components[:comp_idx] + \
+                [components[comp_idx] - sub_pts] + components[comp_idx+1:]
+            # keep the order of nx.connected_components, i.e. by first node
+            sub_first = min(node_order[pt] for pt in sub_pts)
+            insert_idx = comp_idx + 1
+            while insert_idx < len(fragments) and component_first[insert_idx] < sub_first:
+                insert_idx = insert_idx + 1
+            fragments.insert(insert_idx, sub_pts)
+            rb_fragments[rb] = fragments
+
+        return rb_fragments
+
+    def build_rb_index(self, chunk_size=1 << 20):
+        # side_0/side_1: (atom_num, rb_num) boolean matrix, atom i+1 in f_0_set/f_1_set of rb j,
+        # rb in the order of self.rb_data_list
+        # pair_sig: packed bits of the rb separating each atom pair (l, r), l < r
+        rb_order = list(self.rb_data_list[-1].keys()) if len(
+            self.rb_data_list) > 0 else []
+        atom_index = {str(atom+1): atom for atom in range(self.atom_num)}
+
+        side = [np.zeros((self.atom_num, len(rb_order)), dtype=bool)
+                for _ in range(2)]
+        for rb_idx, rb in enumerate(rb_order):
+            for i in range(2):
+                atoms = [atom_index[pt] for pt in self.rb_data[rb]['f_{}_set'.format(i)]
+                         if pt in atom_index]
+                side[i][atoms, rb_idx] = True
+
+        packed = [np.packbits(side[i], axis=1) for i in range(2)]
+        # same order as looping atom_l, then atom_r > atom_l
+        pair_l, pair_r = np.triu_indices(self.atom_num, k=1)
+        pair_sig = np.zeros((len(pair_l), packed[0].shape[1]), dtype=np.uint8)
+        for chunk in range(0, len(pair_l), chunk_size):
+            l_idx = pair_l[chunk:chunk+chunk_size]
+            r_idx = pair_r[chunk:chunk+chunk_size]
+            pair_sig[chunk:chunk+chunk_size] = (packed[0][l_idx] & packed[1][r_idx]) | (
+                packed[1][l_idx] & packed[0][r_idx])
+
+        rb_index = {}
+        rb_index['rb'] = {rb: idx for idx, rb in enumerate(rb_order)}
+        rb_index['side_0'] = side[0]
+        rb_index['side_1'] = side[1]
+        rb_index['pair_l'] = pair_l
+        rb_index['pair_r'] = pair_r
+        rb_index['pair_sig'] = pair_sig
+        return rb_index
+
+    def build_ris_data(self, rb_data, rb_index=None):
+        # group the atom pairs by the set of rb separating them,
+        # the ris groups are listed in order of their first atom pair
         ris_data = {}
 
-        def judge_side_by_metrics(rb_data, candidate_pt):
-            if candidate_pt in rb_data['f_0_set']:
-                return 0
-            if candidate_pt in rb_data['f_1_set']:
-                return 1
-
-        def update_bc_info(ris_data_bond, rb_data, bond_group):
-            bc_num = []
-            for rb in bond_group:
-                bc_num.append(rb_data[rb]['bc_num'])
-            ris_data_bond['avg_bc_num'] = sum(bc_num)/len(bc_num)
-            ris_data_bond['rb_count_num'] = len(bc_num)
-
-        def update_ris_data(ris_data, rb_data, candidate_pair):
-            atom_l = candidate_pair[0]
-            atom_r = candidate_pair[1]
-            bond_group = []
-            for rb, pts_data in rb_data.items():
-                if (atom_l in pts_data['f_0_set'] and atom_r in pts_data['f_1_set']) or (atom_l in pts_data['f_1_set'] and atom_r in pts_data['f_0_set']):
-                    bond_group.append(rb)
-
-            if len(bond_group) == 0:
-                return
-
+        if rb_index is None:
+            rb_index = self.build_rb_index()
+
+        rb_num = len(rb_index['rb'])
+        rb_cols = [rb_index['rb'][rb] for rb in rb_data.keys()]
+        col_mask = np.zeros(rb_num, dtype=bool)
+        col_mask[rb_cols] = True
+        pair_sig = rb_index['pair_sig'] & np.packbits(col_mask)
+
+        pair_idx = np.nonzero(pair_sig.any(axis=1))[0]
+        if len(pair_idx) == 0:
+            return ris_data
+        pair_sig = np.ascontiguousarray(pair_sig[pair_idx])
+        sig_view = pair_sig.view(
+            np.dtype((np.void, pair_sig.shape[1]))).ravel()
+        _, first_pair, pair_group = np.unique(
+            sig_view, return_index=True, return_inverse=True)
+        pair_group = pair_group.ravel()
+        group_order = np.argsort(first_pair)
+
+        # separating rb of each group, columns in the order of rb_data
+        rb_list = list(rb_data.keys())
+        rb_bc_num = [rb_data[rb]['bc_num'] for rb in rb_list]
+        group_bits = np.unpackbits(
+            pair_sig[first_pair], axis=1)[:, rb_cols]
+        group_name = {}
+        group_metrics = np.zeros(len(first_pair), dtype=np.int64)
+        for group in group_order.tolist():
+            bond_idx = np.nonzero(group_bits[group])[0].tolist()
+            bond_group = [rb_list[idx] for idx in bond_idx]
             bond_name = ','.join(bond_group)
-
-            if bond_name not in ris_data.keys():
-                ris_data[bond_name] = {}
-                ris_data[bond_name]['metrics'] = bond_group[0]
-                ris_data[bond_name]['f_0_set'] = set()
-                ris_data[bond_name]['f_1_set'] = set()
-                # update bc score
-                update_bc_info(ris_data[bond_name], rb_data, bond_group)
-
-            for atom in candidate_pair:
-                side = judge_side_by_metrics(
-                    rb_data[ris_data[bond_name]['metrics']], atom)
-                ris_data[bond_name]['f_{}_set'.format(side)].add(atom)
-
-        for atom_l in range(1, self.atom_num+1):
-            for atom_r in range(atom_l+1, self.atom_num+1):
-                candidate_pair = (str(atom_l), str(atom_r))
-                update_ris_data(ris_data, rb_data, candidate_pair)
-        #         print("{}-{}".format(atom_l, atom_r))
+            group_name[group] = bond_name
+            group_metrics[group] = rb_cols[bond_idx[0]]
+
+            bc_num = [rb_bc_num[idx] for idx in bond_idx]
+            ris_data[bond_name] = {}
+            ris_data[bond_name]['metrics'] = bond_group[0]
+            ris_data[bond_name]['f_0_set'] = set()
+            ris_data[bond_name]['f_1_set'] = set()
+            # update bc score
+            ris_data[bond_name]['avg_bc_num'] = sum(bc_num)/len(bc_num)
+            ris_data[bond_name]['rb_count_num'] = len(bc_num)
+
+        # side of every atom by the metrics rb of its group
+        group_atom = np.unique(np.concatenate([pair_group * self.atom_num + rb_index['pair_l'][pair_idx],
+                                               pair_group * self.atom_num + rb_index['pair_r'][pair_idx]]))
+        atom_group = group_atom // self.atom_num
+        atom_idx = group_atom % self.atom_num
+        atom_side = rb_index['side_1'][atom_idx, group_metrics[atom_group]]
+        side_name = ['f_0_set', 'f_1_set']
+        for group, atom, side in zip(atom_group.tolist(), atom_idx.tolist(), atom_side.tolist()):
+            ris_data[group_name[group]][side_name[side]].add(str(atom+1))
 
         # sorted(ris_data, key=lambda ris: (ris['rb_count_num']))
         # sort by num of bond at first (from small to large)
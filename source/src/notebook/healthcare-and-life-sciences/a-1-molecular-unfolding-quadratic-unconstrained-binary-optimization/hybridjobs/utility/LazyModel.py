@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the lazily evaluated model for the after-calc method
+########################################################################################################################
+import dimod
+
+import numpy as np
+import time
+import logging
+
+from .MolGeoCalc import get_tor_map, build_centroid_frame, centroid_distance_batch
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class LazyDistanceModel():
+    # Instead of expanding the D^M distance HUBO terms of the pre-calc method,
+    # the distance energy of each ris group is computed on the fly from the
+    # current torsion angles. The energy of an assignment is
+    # -sum(distance of ris group), and the one-hot constraint is implicit
+    # because every torsion holds exactly one angle index.
+
+    def __init__(self, mol_data, M, D, var, rb_var_map, var_rb_map):
+        self.M = M
+        self.D = D
+        self.theta_option = np.array([x * 360/D for x in range(D)])
+
+        sort_ris_data = mol_data.bond_graph.sort_ris_data[str(M)]
+
+        # torsions of the model, in order of appearance in the ris groups
+        self.rb_name = []
+        for ris in sort_ris_data.keys():
+            for rb in ris.split(','):
+                if rb not in self.rb_name:
+                    self.rb_name.append(rb)
+        self.labels = [var[rb_var_map[rb]][str(d+1)]
+                       for rb in self.rb_name for d in range(D)]
+
+        atom_pos_data = {}
+        for pt, info in mol_data.atom_data.items():
+            atom_pos_data[pt] = {}
+            atom_pos_data[pt]['pts'] = [info['x'], info['y'], info['z']]
+            atom_pos_data[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
+
+        # centroid frame and torsion index of each ris group
+        self.ris_name = []
+        self.ris_tor = []
+        self.ris_frame = []
+        self.tor_ris = [[] for _ in self.rb_name]
+        for ris, rb_set in sort_ris_data.items():
+            torsion_group = ris.split(',')
+            tor_list = [var[rb_var_map[rb]]['1'] for rb in torsion_group]
+            tor_map = get_tor_map(
+                tor_list, rb_set, mol_data.bond_graph.rb_data, var_rb_map)
+            self.ris_name.append(ris)
+            self.ris_tor.append(np.array([self.rb_name.index(rb)
+                                for rb in torsion_group]))
+            self.ris_frame.append(build_centroid_frame(
+                atom_pos_data, rb_set, tor_map, var_rb_map))
+            for rb in torsion_group:
+                self.tor_ris[self.rb_name.index(rb)].append(
+                    len(self.ris_name)-1)
+
+    @property
+    def num_torsions(self):
+        return len(self.rb_name)
+
+    @property
+    def num_variables(self):
+        return len(self.labels)
+
+    def ris_distance(self, ris_idx, angle_idx):
+        # distance of one ris group for (num_reads, num_torsions) angle indices
+        theta_array = self.theta_option[angle_idx[:, self.ris_tor[ris_idx]]]
+        return centroid_distance_batch(self.ris_frame[ris_idx], theta_array)
+
+    def energies(self, angle_idx):
+        angle_idx = np.atleast_2d(angle_idx)
+        return -sum(self.ris_distance(ris_idx, angle_idx) for ris_idx in range(len(self.ris_name)))
+
+    def to_binary(self, angle_idx):
+        # one-hot samples over self.labels, x_{m}_{d} = 1 for the chosen angle d
+        angle_idx = np.atleast_2d(angle_idx)
+        num_reads = angle_idx.shape[0]
+        samples = np.zeros((num_reads, self.num_torsions, self.D), dtype=np.int8)
+        samples[np.arange(num_reads)[:, np.newaxis], np.arange(
+            self.num_torsions)[np.newaxis, :], angle_idx] = 1
+        return samples.reshape(num_reads, -1)
+
+    def from_binary(self, samples):
+        samples = np.asarray(samples).reshape(-1, self.num_torsions, self.D)
+        return np.argmax(samples, axis=2)
+
+    def sample(self, num_reads=100, num_sweeps=100, beta_range=None, seed=None):
+        # simulated annealing over the torsion angles of num_reads replicas at once
+        start = time.time()
+        rng = np.random.default_rng(seed)
+        angle_idx = rng.integers(
+            self.D, size=(num_reads, self.num_torsions))
+        ris_dist = np.stack([self.ris_distance(ris_idx, angle_idx)
+                             for ris_idx in range(len(self.ris_name))], axis=1)
+
+        def _propose(tor_idx):
+            new_idx = angle_idx.copy()
+            shift = rng.integers(1, self.D, size=num_reads)
+            new_idx[:, tor_idx] = (angle_idx[:, tor_idx] + shift) % self.D
+            new_dist = np.stack([self.ris_distance(ris_idx, new_idx)
+                                for ris_idx in self.tor_ris[tor_idx]], axis=1)
+            delta = -(new_dist - ris_dist[:, self.tor_ris[tor_idx]]).sum(axis=1)
+            return new_idx, new_dist, delta
+
+        if beta_range is None:
+            beta_range = self._default_beta_range(_propose)
+        betas = np.geomspace(beta_range[0], beta_range[1], num_sweeps)
+
+        for beta in betas:
+            for tor_idx in range(self.num_torsions):
+                if self.D == 1:
+                    break
+                new_idx, new_dist, delta = _propose(tor_idx)
+                accept = (delta <= 0) | (
+                    rng.random(num_reads) < np.exp(-beta*np.clip(delta, 0, None)))
+                angle_idx[accept, tor_idx] = new_idx[accept, tor_idx]
+                ris_dist[np.ix_(accept, self.tor_ris[tor_idx])
+                         ] = new_dist[accept]
+
+        energies = -ris_dist.sum(axis=1)
+        end = time.time()
+        logging.info(
+            f"lazy model sampled {num_reads} reads with {num_sweeps} sweeps in {end-start} s")
+
+        return dimod.SampleSet.from_samples((self.to_binary(angle_idx), self.labels), dimod.BINARY, energies,
+                                            info={"beta_range": tuple(beta_range), "num_sweeps": num_sweeps})
+
+    def _default_beta_range(self, propose):
+        # same idea as neal: the hottest beta accepts the largest move with
+        # probability 1/2, the coldest one the smallest move with 1/100
+        abs_delta = []
+        if self.D == 1:
+            return (0.1, 10.0)
+        for tor_idx in range(self.num_torsions):
+            abs_delta.append(np.abs(propose(tor_idx)[2]))
+        abs_delta = np.concatenate(abs_delta) if abs_delta else np.array([])
+        abs_delta = abs_delta[abs_delta > 1e-6]
+        if len(abs_delta) == 0:
+            return (0.1, 10.0)
+        return (np.log(2)/abs_delta.max(), np.log(100)/abs_delta.min())
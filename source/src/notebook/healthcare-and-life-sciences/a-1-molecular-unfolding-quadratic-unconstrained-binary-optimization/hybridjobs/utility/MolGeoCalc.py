@@ -88,6 +88,40 @@ def PointRotate3D(p1, p2, p0, theta):
     return final_p
 
 
+"""
+    Return the Rodrigues rotation matrix about the axis from p1 to p2.
+    Arguments: 'axis point 1', 'axis point 2', 'angle of rotation (in radians)' >> '3x3 rotation matrix'
+"""
+
+
+def rotation_matrix(p1, p2, theta):
+    N = np.asarray(p2, dtype=float) - np.asarray(p1, dtype=float)
+    X, Y, Z = N / np.linalg.norm(N)
+
+    c = np.cos(theta)
+    t = 1 - c
+    s = np.sin(theta)
+
+    return np.array([[t*X**2 + c, t*X*Y - s*Z, t*X*Z + s*Y],
+                     [t*X*Y + s*Z, t*Y**2 + c, t*Y*Z - s*X],
+                     [t*X*Z - s*Y, t*Y*Z + s*X, t*Z**2 + c]])
+
+
+"""
+    Return a (N,3) block of points rotated about an arbitrary axis in 3D with one rotation matrix.
+    Same convention and rounding as PointRotate3D, but a single call for the whole block.
+    Arguments: 'axis point 1', 'axis point 2', '(N,3) points to be rotated', 'angle of rotation (in radians)' >> '(N,3) new points'
+"""
+
+
+def PointsRotate3D(p1, p2, pts, theta, rot=None):
+    p1 = np.asarray(p1, dtype=float)
+    pts = np.asarray(pts, dtype=float).reshape(-1, 3)
+    if rot is None:
+        rot = rotation_matrix(p1, p2, theta)
+    return np.round((pts - p1) @ rot.T + p1, 4)
+
+
 def get_idx(var, var_rb_map):
     # 'x_3_2' -> '3' -> '4+5' -> ['4','5']
     return var_rb_map[str(var.split('_')[1])].split('+')
@@ -116,18 +150,24 @@ def get_current_pts(pts_name, pts_dict, mol_data):
 
 
 def update_pts(start_pts, end_pts, pts_list, rotate_theta):
-    rotate_list = []
     logging.debug("start_pts {}".format(start_pts))
     logging.debug("end_pts {}".format(end_pts))
     logging.debug("pts_list {}".format(pts_list))
     pi = 3.1415926
-    for pt in pts_list:
-        if pt['idx'] != (start_pts[0]['pts'], end_pts[0]['pts']):
-            rotate_list.append(PointRotate3D(
-                start_pts[0]['pts'], end_pts[0]['pts'], pt['pts'], rotate_theta/180*pi))
-        else:
-            logging.debug("avoid same rotate *******")
-            rotate_list.append(pt['pts'])
+    if len(pts_list) == 0:
+        return []
+    rotate_bd = (start_pts[0]['pts'], end_pts[0]['pts'])
+    rotate_array = np.array([pt['pts'] for pt in pts_list], dtype=float)
+    rotate_mask = np.array([pt['idx'] != rotate_bd for pt in pts_list])
+    if not rotate_mask.all():
+        logging.debug("avoid same rotate *******")
+    rotate_array[rotate_mask] = PointsRotate3D(
+        rotate_bd[0], rotate_bd[1], rotate_array[rotate_mask], rotate_theta/180*pi)
+    rotate_list = rotate_array.tolist()
+    # keep the untouched points as they are
+    for cn, pt in enumerate(pts_list):
+        if not rotate_mask[cn]:
+            rotate_list[cn] = pt['pts']
     return rotate_list
 
 
@@ -195,7 +235,7 @@ def update_pts_distance(atom_pos_data, rb_set, tor_map, var_rb_map, theta_option
             # update points
             start_pts = atom_pos_data[rb_name.split('+')[0]]
             end_pts = atom_pos_data[rb_name.split('+')[1]]
-            whole_set = set.union(rb_set['f_1_set'], affect_tor_pts_set)
+            whole_set = list(set.union(rb_set['f_1_set'], affect_tor_pts_set))
             gen_pts = _gen_pts_list(whole_set, atom_pos_data)
             theta = theta_option[int(d)-1]
             rotate_list = update_pts([start_pts], [end_pts], gen_pts, theta)
@@ -211,6 +251,119 @@ def update_pts_distance(atom_pos_data, rb_set, tor_map, var_rb_map, theta_option
     return distance
 
 
+def build_centroid_frame(atom_pos_data, rb_set, tor_map, var_rb_map):
+    # rigid rotations commute with taking the mean, so atoms rotated by the same
+    # torsions can be collapsed into one weighted centroid. The bond atoms are
+    # kept as single points because they define the axis of the later torsions.
+    rb_names = [var_rb_map[var_name.split('_')[1]]
+                for var_name in tor_map.keys()]
+    step_sets = [set.union(rb_set['f_1_set'], affect_tor_pts_set)
+                 for affect_tor_pts_set in tor_map.values()]
+
+    def _signature(pt):
+        return tuple(pt in step_set for step_set in step_sets)
+
+    group_pts = {}
+    for side, pt_set in enumerate([rb_set['f_0_set'], rb_set['f_1_set']]):
+        for pt in pt_set:
+            group_pts.setdefault((side, _signature(pt)), []).append(pt)
+
+    axis_name = []
+    for rb_name in rb_names:
+        for pt in rb_name.split('+'):
+            if pt not in axis_name:
+                axis_name.append(pt)
+
+    pts = []
+    member = []
+    weight = []
+    for (side, signature), pt_list in group_pts.items():
+        pts.append(np.mean([atom_pos_data[pt]['pts']
+                   for pt in pt_list], axis=0))
+        member.append(signature)
+        weight.append((len(pt_list) if side == 0 else 0,
+                       len(pt_list) if side == 1 else 0))
+    axis_offset = len(pts)
+    for pt in axis_name:
+        pts.append(atom_pos_data[pt]['pts'])
+        member.append(_signature(pt))
+        weight.append((0, 0))
+
+    frame = {}
+    frame['pts'] = np.array(pts, dtype=float)
+    frame['member'] = np.array(member, dtype=bool).reshape(-1, len(rb_names))
+    weight = np.array(weight, dtype=float)
+    frame['w_0'] = weight[:, 0] / weight[:, 0].sum()
+    frame['w_1'] = weight[:, 1] / weight[:, 1].sum()
+    frame['axis'] = [(axis_offset + axis_name.index(rb_name.split('+')[0]),
+                      axis_offset + axis_name.index(rb_name.split('+')[1])) for rb_name in rb_names]
+    return frame
+
+
+def centroid_distance_func(frame, theta_list):
+    # same result as update_pts_distance(..., True, True), but only the
+    # centroids and the bond atoms of the frame are rotated
+    pi = 3.1415926
+    pts = frame['pts'].copy()
+    for step, theta in enumerate(theta_list):
+        start_idx, end_idx = frame['axis'][step]
+        rot_mask = frame['member'][:, step]
+        p1 = pts[start_idx].copy()
+        rot = rotation_matrix(p1, pts[end_idx], theta/180*pi)
+        pts[rot_mask] = (pts[rot_mask] - p1) @ rot.T + p1
+    return np.linalg.norm(frame['w_0'] @ pts - frame['w_1'] @ pts)
+
+
+def _rotate_frame_step(frame, pts, step, theta):
+    # rotate the points of frame step for a batch of pts (num_batch, num_pts, 3)
+    # by theta (num_batch,) in radian
+    num_batch = pts.shape[0]
+    start_idx, end_idx = frame['axis'][step]
+    rot_mask = frame['member'][:, step]
+    p1 = pts[:, start_idx, :].copy()
+    n = pts[:, end_idx, :] - p1
+    n = n / np.linalg.norm(n, axis=1)[:, np.newaxis]
+    c = np.cos(theta)[:, np.newaxis, np.newaxis]
+    s = np.sin(theta)[:, np.newaxis, np.newaxis]
+    cross = np.zeros((num_batch, 3, 3))
+    cross[:, 0, 1], cross[:, 0, 2] = -n[:, 2], n[:, 1]
+    cross[:, 1, 0], cross[:, 1, 2] = n[:, 2], -n[:, 0]
+    cross[:, 2, 0], cross[:, 2, 1] = -n[:, 1], n[:, 0]
+    rot = c*np.eye(3) + s*cross + (1-c)*np.einsum('bi,bj->bij', n, n)
+    pts[:, rot_mask, :] = np.einsum(
+        'bij,bpj->bpi', rot, pts[:, rot_mask, :] - p1[:, np.newaxis, :]) + p1[:, np.newaxis, :]
+    return pts
+
+
+def centroid_distance_batch(frame, theta_array, share_prefix=False):
+    # centroid_distance_func for a batch of torsion angles, theta_array is
+    # (num_batch, num_torsion) in degree and the result is (num_batch,)
+    # share_prefix: rows with the same leading angles share the rotated points,
+    # every distinct prefix of the torsion angles is rotated only once
+    pi = 3.1415926
+    theta_array = np.atleast_2d(np.asarray(theta_array, dtype=float))/180*pi
+    num_batch = theta_array.shape[0]
+    if not share_prefix:
+        pts = np.repeat(frame['pts'][np.newaxis, :, :], num_batch, axis=0)
+        for step in range(theta_array.shape[1]):
+            pts = _rotate_frame_step(frame, pts, step, theta_array[:, step])
+        return np.linalg.norm(np.einsum('p,bpk->bk', frame['w_0'], pts) - np.einsum('p,bpk->bk', frame['w_1'], pts), axis=1)
+
+    # prefix tree, level by level: node is the prefix of every row
+    node = np.zeros(num_batch, dtype=np.int64)
+    pts = frame['pts'][np.newaxis, :, :].copy()
+    for step in range(theta_array.shape[1]):
+        angle, angle_code = np.unique(
+            theta_array[:, step], return_inverse=True)
+        _, first, inverse = np.unique(
+            node*len(angle) + angle_code.reshape(-1), return_index=True, return_inverse=True)
+        pts = _rotate_frame_step(
+            frame, pts[node[first]], step, theta_array[first, step])
+        node = inverse.reshape(-1)
+    distance = np.linalg.norm(np.einsum('p,bpk->bk', frame['w_0'], pts) - np.einsum('p,bpk->bk', frame['w_1'], pts), axis=1)
+    return distance[node]
+
+
 def atom_distance_func(rotate_values, mol_data, var_rb_map, theta_option, M):
     # save temp results for pts
     temp_pts_dict = {}
@@ -321,6 +474,29 @@ def get_same_direction_set(candidate_set, rb_data, rb_name):
     return direction_set
 
 
+def get_tor_map(tor_list, rb_set, rb_data, var_rb_map):
+    # build map for affected tor
+    tor_map = {}
+    tor_len = len(tor_list)
+    for base_idx in range(tor_len):
+        tor_name = tor_list[base_idx]
+        tor_map[tor_name] = set()
+        base_rb_name = var_rb_map[tor_list[base_idx].split('_')[1]]
+
+        # get direction set
+        direction_set = get_same_direction_set(
+            rb_set['f_1_set'], rb_data, base_rb_name)
+
+        for candi_idx in range(base_idx, tor_len):
+            candi_rb_name = var_rb_map[tor_list[candi_idx].split('_')[
+                1]].split('+')
+            for rb in candi_rb_name:
+                if rb in direction_set:
+                    tor_map[tor_name].add(rb)
+
+    return tor_map
+
+
 def mol_distance_func(atom_pos_data, check, set):
     max_idx = max([int(num) for num in atom_pos_data.keys()])
 
@@ -6,14 +6,13 @@
 ########################################################################################################################
 
 
-from biopandas.mol2 import PandasMol2
 import pandas as pd
 import numpy as np
-import re
 
 import logging
 import pickle  # nosec
 import os
+import re
 
 from .GraphModel import BuildMolGraph
 
@@ -21,10 +20,80 @@ log = logging.getLogger()
 log.setLevel('INFO')
 
 
+def read_mol2_records(mol_file):
+    # stream a (multi-molecule) mol2 file and yield one record per @<TRIPOS>MOLECULE,
+    # the ATOM and BOND blocks are read in the same pass into numpy arrays
+    record = None
+    section = None
+    atom_fields = []
+    bond_fields = []
+
+    def _make_record(record, atom_fields, bond_fields):
+        atom_num = len(atom_fields)
+        record['atom_id'] = np.array([int(field[0])
+                                     for field in atom_fields], dtype=np.int64)
+        record['atom_name'] = [field[1] for field in atom_fields]
+        record['pts'] = np.array([field[2:5] for field in atom_fields],
+                                 dtype=float).reshape((atom_num, 3))
+        record['atom_type'] = [field[5] for field in atom_fields]
+        record['subst_id'] = np.array([int(field[6]) if len(field) > 6 else 0
+                                       for field in atom_fields], dtype=np.int64)
+        record['subst_name'] = [field[7] if len(field) > 7 else ''
+                                for field in atom_fields]
+        record['charge'] = np.array([float(field[8]) if len(field) > 8 else 0.0
+                                     for field in atom_fields], dtype=float)
+        record['bond_id'] = [field[0] for field in bond_fields]
+        record['bond_atom'] = np.array([field[1:3] for field in bond_fields],
+                                       dtype=np.int64).reshape((len(bond_fields), 2))
+        record['bond_type'] = [field[3] for field in bond_fields]
+        return record
+
+    with open(mol_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            if line.startswith('@<TRIPOS>'):
+                section = line[len('@<TRIPOS>'):]
+                if section == 'MOLECULE':
+                    if record is not None:
+                        yield _make_record(record, atom_fields, bond_fields)
+                    record = {'name': None, 'header': []}
+                    atom_fields = []
+                    bond_fields = []
+                continue
+            if record is None:
+                continue
+            if section == 'MOLECULE':
+                # name, counts, molecule type, charge type, ...
+                record['header'].append(line)
+                if record['name'] is None:
+                    record['name'] = line
+            elif section == 'ATOM':
+                atom_fields.append(line.split())
+            elif section == 'BOND':
+                bond_fields.append(line.split())
+
+    if record is not None:
+        yield _make_record(record, atom_fields, bond_fields)
+
+
+def mol2_record_name(mol_file, idx, record):
+    # {file name}_{record index}_{molecule name} of a read_mol2_records item.
+    # The index keeps repeated molecule names (protomers, tautomers) apart, and
+    # characters that can not be in a file name are replaced, as
+    # MoleculeData.save() uses the name
+    file_name = mol_file.split('/')[-1].split('.')[0]
+    mol_name = record['name'] if record['name'] else 'mol'
+    return re.sub(r'[^\w.-]', '_', f"{file_name}_{idx}_{mol_name}")
+
+
 class MoleculeData():
 
-    def __init__(self, mol_file, function, name=None):
+    def __init__(self, mol_file, function, name=None, record=None):
         # parse file
+        # record: one item of read_mol2_records, parse this record instead of
+        # the first molecule in mol_file
         self.mol = None
         self.name = None
         file_type = mol_file.split('.')[-1]
@@ -36,11 +105,15 @@ class MoleculeData():
 
         if file_type == 'mol2':
             logging.info("parse mol2 file!")
-            self.mol = PandasMol2().read_mol2(mol_file)
-            self.bond = self.bond_parset(mol_file)
-
-            self.atom_num = self.mol.df['atom_id'].max()
-            self.atom_data = self.atom_parset()
+            if record is None:
+                record = next(read_mol2_records(mol_file), None)
+            if record is None:
+                raise Exception(f"no molecule found in {mol_file}!")
+            self.mol = record
+            self.bond = self.bond_parset(record)
+
+            self.atom_num = int(record['atom_id'].max())
+            self.atom_data = self.atom_parset(record)
             self._add_van_der_waals()
             self.bond_graph = BuildMolGraph(self.bond, self.atom_num)
         else:
@@ -48,6 +121,13 @@ class MoleculeData():
                 "file type {} not supported! only support mol2,pdb".format(file_type))
             raise Exception("file type not supported!")
 
+    @classmethod
+    def iter_mol2(cls, mol_file, function):
+        # one MoleculeData for each molecule of a multi-molecule mol2 file,
+        # named by mol2_record_name
+        for idx, record in enumerate(read_mol2_records(mol_file)):
+            yield cls(mol_file, function, name=mol2_record_name(mol_file, idx, record), record=record)
+
     def _add_van_der_waals(self):
         # https://en.wikipedia.org/wiki/Van_der_Waals_radius
         van_der_waals_dict = {'H': 1.2, 'C': 1.7, 'N': 1.55,
@@ -60,25 +140,26 @@ class MoleculeData():
             self.atom_data[pt]['vdw-radius'] = van_der_waals_dict[_parse_atom(
                 self.atom_data[pt]['atom_type'])]
 
-    def bond_parset(self, filename):
-        with open(filename, 'r') as f:
-            f_text = f.read()
-    #     print(f_text)
-        search_result = re.search(r'@<TRIPOS>BOND([a-z0-9\s]*)', f_text)
-    #     print("research result {}".format(search_result))
-        group_result = search_result.group(1)
-    #     print("group result {}".format(group_result))
-        bonds = np.array(re.sub(
-            r'\s+', ' ', re.search(r'@<TRIPOS>BOND([a-z0-9\s]*)', f_text).group(1)).split()).reshape((-1, 4))
-
-        df_bonds = pd.DataFrame(
-            bonds, columns=['bond_id', 'atom1', 'atom2', 'bond_type'])
+    def bond_parset(self, record):
+        df_bonds = pd.DataFrame({'bond_id': record['bond_id'],
+                                 'atom1': record['bond_atom'][:, 0].astype(str),
+                                 'atom2': record['bond_atom'][:, 1].astype(str),
+                                 'bond_type': record['bond_type']})
         df_bonds.set_index(['bond_id'], inplace=True)
         return df_bonds
 
-    def atom_parset(self):
-        self.mol.df['atom_id'] = self.mol.df.atom_id.astype('str')
-        return self.mol.df.set_index('atom_id').T.to_dict('dict')
+    def atom_parset(self, record):
+        atom_data = {}
+        for idx, atom_id in enumerate(record['atom_id'].tolist()):
+            atom_data[str(atom_id)] = {'atom_name': record['atom_name'][idx],
+                                       'x': float(record['pts'][idx, 0]),
+                                       'y': float(record['pts'][idx, 1]),
+                                       'z': float(record['pts'][idx, 2]),
+                                       'atom_type': record['atom_type'][idx],
+                                       'subst_id': int(record['subst_id'][idx]),
+                                       'subst_name': record['subst_name'][idx],
+                                       'charge': float(record['charge'][idx])}
+        return atom_data
 
     def save(self, version, path=None):
         save_path = None
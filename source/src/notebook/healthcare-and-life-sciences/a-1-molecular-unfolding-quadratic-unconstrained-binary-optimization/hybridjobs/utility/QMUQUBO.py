@@ -5,9 +5,14 @@
 #   The following class is the construction of QUBO model
 ########################################################################################################################
 import dimod
-from .MolGeoCalc import update_pts_distance, get_same_direction_set
+import numpy as np
+from .MolGeoCalc import update_pts_distance, get_tor_map, build_centroid_frame, centroid_distance_func
+from .SparseQUBO import SparseQUBO
+from .LazyModel import LazyDistanceModel
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import time
 import logging
 import pickle  # nosec
@@ -49,7 +54,9 @@ class QMUQUBO():
                     self.model_info[mt][param] = set()
             elif mt == "after-calc":
                 logging.info(
-                    "initial after calculate for constructing molecule QUBO not implemented !!")
+                    "initial after calculate for constructing molecule model")
+                for param in self.param[mt]["param"]:
+                    self.model_info[mt][param] = set()
             else:
                 logging.info(f"only pre-calculate(method='pre-calc') and after-calculate(method='after-calc') are supported, \
                 method {mt} not support !!")
@@ -59,17 +66,67 @@ class QMUQUBO():
             model_param = config
             if method == "pre-calc":
                 self._build_pre_calc_model(**model_param)
+            elif method == "after-calc":
+                self._build_after_calc_model(**model_param)
         return 0
 
+    def _build_after_calc_model(self, **model_param):
+        for M in model_param["M"]:
+            for D in model_param["D"]:
+                # update var_map
+                # prepare variables
+                self.var, self.var_rb_map, self.rb_var_map = self._prepare_var(
+                    self.mol_data, D)
+                model_name = f"{M}_{D}"
+                # check availability
+                if model_name in self.model_qubo["after-calc"].keys():
+                    logging.info(
+                        f"duplicate model !! pass !! M:{M},D:{D}")
+                    continue
+                else:
+                    self._update_model_info(
+                        [M, D], ["M", "D"], "after-calc")
+                start = time.time()
+                # no hubo terms, the distances are evaluated during sampling
+                model = LazyDistanceModel(
+                    self.mol_data, M, D, self.var, self.rb_var_map, self.var_rb_map)
+                end = time.time()
+
+                self.model_qubo["after-calc"][model_name] = {}
+                self.model_qubo["after-calc"][model_name]["qubo"] = model
+                self.model_qubo["after-calc"][model_name]["var"] = self.var
+                self.model_qubo["after-calc"][model_name]["var_rb_map"] = self.var_rb_map
+                self.model_qubo["after-calc"][model_name]["rb_var_map"] = self.rb_var_map
+                self.model_qubo["after-calc"][model_name]["time"] = end-start
+                self.model_qubo["after-calc"][model_name]["model_name"] = model_name
+                self.model_qubo["after-calc"][model_name]["rb_name"] = [
+                    name for name in model.ris_name if len(name.split(',')) == 1]
+
+                logging.info(
+                    f"Construct model for M:{M},D:{D} {(end-start)/60} min")
+
     def _build_pre_calc_model(self, **model_param):
+        # distance terms: "atom" rotates every atom of the fragments,
+        # "centroid" only rotates the fragment centroids and the bond atoms
+        distance_method = model_param.get("distance", "atom")
+        # number of processes to build the hubo terms of the ris groups
+        workers = model_param.get("workers", 1)
+        # "dict": defaultdict keyed by variable names, "sparse": SparseQUBO arrays
+        qubo_format = model_param.get("qubo_format", "dict")
         for M in model_param["M"]:
             for D in model_param["D"]:
+                # update var_map
+                # prepare variables
+                self.var, self.var_rb_map, self.rb_var_map = self._prepare_var(
+                    self.mol_data, D)
+                theta_option = [x * 360/D for x in range(D)]
+                # the distance terms only depend on M and D, and the constraint
+                # terms are linear in A, so build them once (with A=1) for all the
+                # A/hubo_qubo_val combinations below
+                hubo_constraints = None
+                hubo_distances = None
                 for A in model_param["A"]:
                     for hubo_qubo_val in model_param["hubo_qubo_val"]:
-                        # update var_map
-                        # prepare variables
-                        self.var, self.var_rb_map, self.rb_var_map = self._prepare_var(
-                            self.mol_data, D)
                         model_name = f"{M}_{D}_{A}_{hubo_qubo_val}"
                         # check availability
                         if model_name in self.model_qubo["pre-calc"].keys():
@@ -80,12 +137,16 @@ class QMUQUBO():
                             self._update_model_info([M, D, A, hubo_qubo_val], [
                                                     "M", "D", "A", "hubo_qubo_val"], "pre-calc")
                         start = time.time()
+                        if hubo_distances is None:
+                            hubo_constraints, hubo_distances = self._build_qubo_pre_calc(self.mol_data, M, D, 1, self.var,
+                                                                                         self.rb_var_map, self.var_rb_map,
+                                                                                         theta_option, distance_method, workers)
+                        else:
+                            logging.info(
+                                f"reuse distance terms for M:{M},D:{D}")
                         hubo = {}
-                        theta_option = [x * 360/D for x in range(D)]
-                        hubo_constraints, hubo_distances = self._build_qubo_pre_calc(self.mol_data, M, D, A, self.var,
-                                                                                     self.rb_var_map, self.var_rb_map,
-                                                                                     theta_option)
-                        hubo.update(hubo_constraints)
+                        hubo.update({key: A*value for key,
+                                    value in hubo_constraints.items()})
                         hubo.update(hubo_distances)
                         # transfer hubo to qubo
                         # TODO why make_quadratic not work?
@@ -93,7 +154,10 @@ class QMUQUBO():
                         #     hubo, hubo_qubo_val, dimod.BINARY).to_qubo()
                         qubo_raw = dimod.make_quadratic(
                             hubo, hubo_qubo_val, dimod.BINARY)
-                        qubo = self._manual_qubo(qubo_raw.to_qubo())
+                        if qubo_format == "sparse":
+                            qubo = self._sparse_qubo(qubo_raw)
+                        else:
+                            qubo = self._manual_qubo(qubo_raw.to_qubo())
                         end = time.time()
 
                         self.model_qubo["pre-calc"][model_name] = {}
@@ -125,6 +189,13 @@ class QMUQUBO():
 
         return qubo
 
+    def _sparse_qubo(self, qubo_raw):
+        # same terms as _manual_qubo, the offset of to_qubo() is dropped as well
+        qubo = SparseQUBO.from_bqm(qubo_raw)
+        qubo.offset = 0.0
+
+        return qubo
+
     def _update_model_info(self, values, names, method):
         for value, name in zip(values, names):
             self.model_info[method][name].add(value)
@@ -144,6 +215,9 @@ class QMUQUBO():
             if method == "pre-calc":
                 logging.info(
                     "The model_name should be {M}_{D}_{A}_{hubo_qubo_val}")
+            elif method == "after-calc":
+                logging.info(
+                    "The model_name should be {M}_{D}")
             for param, value in info.items():
                 logging.info("param: {}, value {}".format(param, value))
 
@@ -195,7 +269,7 @@ class QMUQUBO():
             self.atom_pos_data[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
             self.atom_pos_data[pt]['vdw-radius'] = info['vdw-radius']
 
-    def _build_qubo_pre_calc(self, mol_data, M, D, A, var, rb_var_map, var_rb_map, theta_option):
+    def _build_qubo_pre_calc(self, mol_data, M, D, A, var, rb_var_map, var_rb_map, theta_option, distance_method="atom", workers=1):
         # initial constraint
         hubo_constraints = {}
 
@@ -215,74 +289,97 @@ class QMUQUBO():
         # update distance term
         hubo_distances = {}
 
-        def _gen_pts_pos_list(pt_set, atom_pos_data):
-            return [atom_pos_data[pt]['pts'] for pt in pt_set]
-
-        def _gen_pts_list(pt_set, atom_pos_data):
-            return [atom_pos_data[pt] for pt in pt_set]
-
-        def update_hubo(torsion_group, up_list, ris):
-            if len(torsion_group) == 1:
-                for d in range(D):
-                    tor_list = up_list + \
-                        [var[rb_var_map[torsion_group[0]]][str(d+1)]]
-                    # distance
-                    final_list_name = []
-                    if len(tor_list) == 1:
-                        final_list_name = tor_list + tor_list
-                    else:
-                        final_list_name = tor_list
-
-                    # update temp points and distance
-                    self._init_mol_file()
-
-                    rb_set = self.mol_data.bond_graph.sort_ris_data[str(
-                        M)][ris]
-
-                    # build map for affected tor
-                    tor_map = {}
-                    tor_len = len(tor_list)
-                    for base_idx in range(tor_len):
-                        tor_name = tor_list[base_idx]
-                        tor_map[tor_name] = set()
-                        base_rb_name = var_rb_map[tor_list[base_idx].split('_')[
-                            1]]
-
-                        # get direction set
-                        direction_set = get_same_direction_set(
-                            rb_set['f_1_set'], self.mol_data.bond_graph.rb_data, base_rb_name)
-
-                        for candi_idx in range(base_idx, tor_len):
-                            candi_rb_name = var_rb_map[tor_list[candi_idx].split('_')[
-                                1]].split('+')
-                            for rb in candi_rb_name:
-                                if rb in direction_set:
-                                    tor_map[tor_name].add(rb)
-
-                    distance = update_pts_distance(
-                        self.atom_pos_data, rb_set, tor_map, var_rb_map, theta_option, True, True)
-
-                    hubo_distances[tuple(final_list_name)] = -distance
-                    logging.debug(
-                        f"final list {tor_list} with distance {distance}")
-            else:
-                for d in range(D):
-                    final_list = up_list + \
-                        [var[rb_var_map[torsion_group[0]]][str(d+1)]]
-                    update_hubo(torsion_group[1:], final_list, ris)
+        # immutable coordinates shared by all the ris groups
+        atom_name = list(mol_data.atom_data.keys())
+        atom_pts = np.array([[info['x'], info['y'], info['z']]
+                            for info in mol_data.atom_data.values()], dtype=float)
+        atom_pts.setflags(write=False)
 
+        ris_args = []
         for ris in mol_data.bond_graph.sort_ris_data[str(M)].keys():
-            start = time.time()
             logging.debug(f"ris group {ris} ")
-            end = time.time()
             torsion_group = ris.split(",")
             if len(torsion_group) == 1:
                 # update constraint
                 update_constraint(ris, hubo_constraints)
             logging.debug(torsion_group)
-            # update hubo terms
-            update_hubo(torsion_group, [], ris)
-            logging.debug(
-                f"elapsed time for torsion group {ris} : {(end-start)/60} min")
+            rb_set = mol_data.bond_graph.sort_ris_data[str(M)][ris]
+            rb_data = {rb: mol_data.bond_graph.rb_data[rb]
+                       for rb in torsion_group}
+            ris_args.append((ris, rb_set, rb_data, atom_name, atom_pts, var,
+                            rb_var_map, var_rb_map, theta_option, distance_method))
+
+        # update hubo terms
+        if workers > 1 and len(ris_args) > 1:
+            logging.info(
+                f"build hubo terms of {len(ris_args)} ris groups with {workers} workers")
+            chunksize = max(1, len(ris_args)//(4*workers))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                ris_hubo_list = list(executor.map(
+                    build_ris_hubo, *zip(*ris_args), chunksize=chunksize))
+        else:
+            ris_hubo_list = [build_ris_hubo(*args) for args in ris_args]
+
+        for ris_hubo in ris_hubo_list:
+            hubo_distances.update(ris_hubo)
 
         return hubo_constraints, hubo_distances
+
+
+def build_ris_hubo(ris, rb_set, rb_data, atom_name, atom_pts, var, rb_var_map, var_rb_map, theta_option, distance_method="atom"):
+    # build the distance HUBO terms of one ris group from its own arguments only,
+    # so that the ris groups can be built in worker processes
+    start = time.time()
+    ris_hubo = {}
+    D = len(theta_option)
+
+    def _init_pos_data():
+        atom_pos_data = {}
+        for pt, pos in zip(atom_name, atom_pts.tolist()):
+            atom_pos_data[pt] = {}
+            atom_pos_data[pt]['pts'] = pos
+            atom_pos_data[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
+        return atom_pos_data
+
+    torsion_group = ris.split(",")
+    tor_var_list = [[var[rb_var_map[rb]][str(d+1)] for d in range(D)]
+                    for rb in torsion_group]
+
+    centroid_frame = None
+    if distance_method == "centroid":
+        # the affected points only depend on the torsions, not on their angles
+        centroid_frame = build_centroid_frame(_init_pos_data(), rb_set, get_tor_map(
+            [tor_var[0] for tor_var in tor_var_list], rb_set, rb_data, var_rb_map), var_rb_map)
+
+    for tor_list in itertools.product(*tor_var_list):
+        tor_list = list(tor_list)
+        # distance
+        final_list_name = []
+        if len(tor_list) == 1:
+            final_list_name = tor_list + tor_list
+        else:
+            final_list_name = tor_list
+
+        if distance_method == "centroid":
+            theta_list = [theta_option[int(tor.split('_')[2])-1]
+                          for tor in tor_list]
+            distance = centroid_distance_func(centroid_frame, theta_list)
+        else:
+            # update temp points and distance
+            atom_pos_data = _init_pos_data()
+
+            # build map for affected tor
+            tor_map = get_tor_map(tor_list, rb_set, rb_data, var_rb_map)
+
+            distance = update_pts_distance(
+                atom_pos_data, rb_set, tor_map, var_rb_map, theta_option, True, True)
+
+        ris_hubo[tuple(final_list_name)] = -distance
+        logging.debug(
+            f"final list {tor_list} with distance {distance}")
+
+    end = time.time()
+    logging.debug(
+        f"elapsed time for torsion group {ris} : {(end-start)/60} min")
+
+    return ris_hubo
@@ -5,23 +5,36 @@
 #   The following class is for different kinds of annealing optimizer
 ########################################################################################################################
 from pickletools import optimize  # nosec
-import boto3
+import numpy as np
 import json
 import pickle  # nosec
 import os
 import datetime
 import logging
+import itertools
 import re
 
-from .MolGeoCalc import update_pts_distance, get_same_direction_set, calc_distance_between_pts
+from .MolGeoCalc import update_pts_distance, get_same_direction_set, \
+    get_tor_map, build_centroid_frame, centroid_distance_batch
 from .MoleculeParser import MoleculeData
+from .ResultStore import load_result_arrays, head_samples
+from .ClashCheck import ClashChecker
+from .ConformerCache import ConformerCache
+from .ConformerWriter import write_conformers
 
-import py3Dmol
 import time
-from ipywidgets import interact, fixed, IntSlider
-import ipywidgets
 
-s3_client = boto3.client("s3")
+# created on first use, importing this module needs no AWS region or credentials
+s3_client = None
+
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client("s3")
+    return s3_client
+
 
 log = logging.getLogger()
 log.setLevel('INFO')
@@ -65,16 +78,19 @@ class ResultParser():
         # initial parameter file
         self.parameters = {}
         self._init_parameters()
+        self._init_ris_frame()
+        self.atom_name = list(self.mol_data.atom_data.keys())
+        self.conformer_cache = ConformerCache()
 
         # parameters
         self.physical_check = True
         if self.physical_check == True:
-            self.non_contact_atom_map = self._init_non_contact_atom()
+            self.clash_checker = ClashChecker.from_mol_data(self.mol_data)
 
         # keep N recent results
-        self.N = 100
+        self.N = param.get("N", 100)
         self.tried_combination = set()
-        if self.method == "dwave-sa" or self.method == "neal-sa":
+        if self.method == "dwave-sa" or self.method == "neal-sa" or self.method == "numpy-sa" or self.method == "numpy-pt":
             logging.info("parse simulated annealer result")
             self.result = None
         elif self.method == "dwave-qa":
@@ -83,20 +99,6 @@ class ResultParser():
                 self.bucket, self.prefix, self.task_id, "results.json")
             self.result = json.loads(obj["Body"].read())
 
-    def _init_non_contact_atom(self):
-        mol_graph = self.mol_data.bond_graph.mol_ug
-
-        non_contact_atom_map = {}
-
-        for node_main in mol_graph.nodes:
-            non_contact_atom = []
-            for node_candidate in mol_graph.nodes:
-                if node_candidate != node_main and node_candidate not in mol_graph.neighbors(node_main):
-                    non_contact_atom.append(node_candidate)
-            non_contact_atom_map[node_main] = non_contact_atom
-
-        return non_contact_atom_map
-
     def _init_parameters(self):
         logging.info("_init_parameters")
         self.parameters["volume"] = {}
@@ -123,16 +125,21 @@ class ResultParser():
         logging.info("_read_result_obj")
         key = f"{prefix}/{task_id}/{file_name}"
         logging.info(f"_read_result_obj: {key}")
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
+        obj = get_s3_client().get_object(Bucket=bucket, Key=key)
         return obj
 
     def _load_raw_result(self):
         logging.info("_load_raw_result")
         if self.method != "dwave-qa":
             logging.info(f"load simulated annealer {self.method} raw result")
+            array_path = f"./{self.method}_result"
             full_path = f"./{self.method}_result.pickle"
-            with open(full_path, "rb") as f:
-                self.raw_result = pickle.load(f)  # nosec
+            # use the latest of the array result and the pickle fallback
+            if os.path.isdir(array_path) and (not os.path.exists(full_path) or os.path.getmtime(os.path.join(array_path, "result.json")) >= os.path.getmtime(full_path)):
+                self.raw_result = load_result_arrays(array_path)
+            else:
+                with open(full_path, "rb") as f:
+                    self.raw_result = pickle.load(f)  # nosec
         elif self.method == "dwave-qa":
             logging.info("load quantum annealer raw result")
             obj = self._read_result_obj(
@@ -200,43 +207,52 @@ class ResultParser():
     def generate_optimize_pts(self):
         logging.info("generate_optimize_pts()")
         # get best configuration
-        pddf_sample_result = self.raw_result["response"].aggregate(
-        ).to_pandas_dataframe()
-
-        pddf_head_sample = pddf_sample_result.sort_values(
-            by=['energy']).head(self.N)
+        pddf_head_sample = head_samples(self.raw_result["response"], self.N)
+
+        # decode all rows to angle indices and evaluate every candidate at once
+        row_onehot = self._decode_samples(pddf_head_sample)
+        valid_row = (row_onehot.sum(axis=2) == 1).all(axis=1)
+        row_angle = row_onehot.argmax(axis=2)
+        row_candidates = []
+        for row in range(len(row_onehot)):
+            if valid_row[row]:
+                row_candidates.append([tuple(row_angle[row].tolist())])
+            else:
+                row_candidates.append(
+                    self._row_candidates(row_onehot[row]))
+        logging.info(
+            f"{valid_row.sum()} of {len(valid_row)} rows satisfy the one-hot constraint")
+        candidate_list = list(dict.fromkeys(
+            candidate for candidates in row_candidates for candidate in candidates))
+        self.candidate_volume = dict(zip(candidate_list, self._evaluate_batch(
+            np.array(candidate_list, dtype=np.int64).reshape(-1, len(self.valid_var_name)))))
 
         evaluate_loop_result = False
         max_optimize_gain = 1.0
         chosen_var = None
         actual_var = None
-        max_tor_list = None
-        max_ris = None
         max_volume = 0
+        index = -1
 
-        for index, row in pddf_head_sample.iterrows():
-            generate_row = self._generate_row_data(row)
-
+        for row, (index, candidates) in enumerate(zip(pddf_head_sample.index, row_candidates)):
             max_optimize_gain = 1.0
             evaluate_loop_result = False
-            for complete_tor_info in generate_row:
-                logging.info(f"chosen var {complete_tor_info['chosen_var']}")
-                logging.info(f"tor list {complete_tor_info['actual_var']}")
-#                 logging.info(f"max_ris {complete_tor_info['max_ris']}")
-#                 logging.info(f"max_tor_list {complete_tor_info['max_tor_list']}")
-                if tuple(complete_tor_info['actual_var']) in self.tried_combination:
+            for candidate in candidates:
+                if candidate in self.tried_combination:
                     logging.info(f"pass current duplicate var")
                     continue
                 else:
-                    self.tried_combination.add(
-                        tuple(complete_tor_info['actual_var']))
-                optimize_gain, optimize_volume = self._evaluate_one_result(
-                    complete_tor_info['tor_list'])
+                    self.tried_combination.add(candidate)
+                optimize_volume = self.candidate_volume[candidate]
+                optimize_gain = optimize_volume / \
+                    self.parameters["volume"]["initial"]
                 if optimize_gain > max_optimize_gain:
+                    logging.info(
+                        f"tor list {self._candidate_var(candidate)} optimize_gain {optimize_gain}")
                     # update final position for visualization
                     self._init_mol_file(self.atom_pos_data)
                     self._update_physical_position(
-                        complete_tor_info['max_ris'], complete_tor_info['max_tor_list'])
+                        self.max_ris, self._candidate_tor_list(candidate))
 
                     physical_check_result = True
                     if self.physical_check == True:
@@ -252,10 +268,8 @@ class ResultParser():
                             evaluate_loop_result = True
                             max_optimize_gain = optimize_gain
                             max_volume = optimize_volume
-                            chosen_var = complete_tor_info['chosen_var']
-                            actual_var = complete_tor_info['actual_var']
-                            max_tor_list = complete_tor_info['max_tor_list']
-                            max_ris = complete_tor_info['max_ris']
+                            chosen_var = self._chosen_var(row_onehot[row])
+                            actual_var = self._candidate_var(candidate)
 
             if evaluate_loop_result == True:
                 break
@@ -282,7 +296,39 @@ class ResultParser():
         self.parameters["volume"]["optimize_info"]["optimize_state"] = evaluate_loop_result
         self.parameters["volume"]["optimize_info"]["result_rank"] = index+1
 
-    def _update_physical_position(self, max_ris, max_tor_list):
+    def get_top_conformers(self, k=10):
+        # coordinates (k, num_atoms, 3) of the k candidates of generate_optimize_pts
+        # with the largest gain that pass the physical check
+        ranked = sorted(self.candidate_volume.items(),
+                        key=lambda item: item[1], reverse=True)
+        conformers = []
+        conformer_info = []
+        for candidate, optimize_volume in ranked:
+            if len(conformers) == k:
+                break
+            self._init_mol_file(self.atom_pos_data_temp)
+            self._update_physical_position(
+                self.max_ris, self._candidate_tor_list(candidate), self.atom_pos_data_temp)
+            pts = np.array([self.atom_pos_data_temp[pt]['pts']
+                           for pt in self.atom_name], dtype=float)
+            if self.physical_check == True and self.clash_checker.check(pts) == False:
+                continue
+            conformers.append(pts)
+            conformer_info.append({"gain": optimize_volume / self.parameters["volume"]["initial"],
+                                   "unfolding_results": sorted(self._candidate_var(candidate))})
+        return np.array(conformers).reshape(-1, len(self.atom_name), 3), conformer_info
+
+    def save_conformers(self, save_name, k=10, file_type="mol2"):
+        # write the top k conformers into one mol2/sdf/xyz file
+        conformers, conformer_info = self.get_top_conformers(k)
+        titles = [f"{self.mol_data.name}_{rank+1} gain {info['gain']:.6f}" for rank,
+                  info in enumerate(conformer_info)]
+        conformer_save_name = f"{self.mol_file_name.split('mol2')[0][:-1]}_{self.method}_{save_name}.{file_type}"
+        write_conformers(conformer_save_name, self.mol_data.mol,
+                         conformers, titles, file_type)
+        return conformer_save_name, conformer_info
+
+    def _update_physical_position(self, max_ris, max_tor_list, atom_pos_data=None):
         #         temp for debugging
         #         max_ris = '4+5'
         #         self.M = '1'
@@ -293,198 +339,117 @@ class ResultParser():
         #         max_ris = '4+5,2+4,1+2,10+11'
         #         self.M = '1'
         #         max_tor_list = ['x_3_3', 'x_1_1', 'x_2_1', 'x_4_1']
+        if atom_pos_data is None:
+            atom_pos_data = self.atom_pos_data
         rb_set = self.mol_data.bond_graph.sort_ris_data[str(
             self.M)][max_ris]
-        for tor in max_tor_list:
+
+        # continue from the longest rotated prefix of the torsion assignment
+        key = (max_ris,) + tuple(max_tor_list)
+        start, pts = self.conformer_cache.longest_prefix(key, min_length=2)
+        if pts is not None:
+            for pt, pt_value in zip(self.atom_name, pts.tolist()):
+                atom_pos_data[pt]['pts'] = pt_value
+            start = start - 1
+
+        for tor_idx in range(start, len(max_tor_list)):
+            tor = max_tor_list[tor_idx]
             tor_map = {}
             base_rb_name = self.var_rb_map[tor.split('_')[1]]
             # get direction set
             tor_map[tor] = get_same_direction_set(
                 rb_set['f_1_set'], self.mol_data.bond_graph.rb_data, base_rb_name)
 
-            update_pts_distance(self.atom_pos_data, rb_set, tor_map,
+            update_pts_distance(atom_pos_data, rb_set, tor_map,
                                 self.var_rb_map, self.theta_option, True, False)
+            self.conformer_cache.put(
+                key[:tor_idx+2], [atom_pos_data[pt]['pts'] for pt in self.atom_name])
+
+    def _init_ris_frame(self):
+        # centroid frame of every ris group, the torsion angles only enter
+        # as rotation angles so the frames are built once for all candidates
+        sort_ris_data = self.mol_data.bond_graph.sort_ris_data[str(self.M)]
+        self.ris_tor = []
+        self.ris_frame = []
+        self.max_ris = None
+        max_ris_num = 1
+        raw_volume = 0
+        for ris, rb_set in sort_ris_data.items():
+            torsion_group = ris.split(",")
+            tor_list = [f'X_{self.rb_var_map[rb_name]}_1' for rb_name in torsion_group]
+            tor_map = get_tor_map(
+                tor_list, rb_set, self.mol_data.bond_graph.rb_data, self.var_rb_map)
+            self.ris_tor.append(np.array([self.valid_var_name.index(
+                self.rb_var_map[rb_name]) for rb_name in torsion_group], dtype=np.int64))
+            self.ris_frame.append(build_centroid_frame(
+                self.atom_pos_data_raw, rb_set, tor_map, self.var_rb_map))
+
+            # the largest ris group is used for the final position
+            if len(torsion_group) >= max_ris_num:
+                max_ris_num = len(torsion_group)
+                self.max_ris = ris
+
+            raw_distance = update_pts_distance(
+                self.atom_pos_data_raw, rb_set, None, None, None, False, True)
+            raw_volume = raw_volume + raw_distance
+
+        self.parameters["volume"]["initial"] = raw_volume
+        logging.info(f"initial {self.parameters['volume']['initial']}")
 
-    def _generate_row_data(self, candidate_result):
-        M = self.M
-        D = self.D
-
-        generate_row = []
-
-        logging.debug("generate_optimize_pts model_info={}".format(
-            self.raw_result["model_info"]))
-
-        best_config = candidate_result.filter(items=self.valid_var_angle)
-
-        chosen_var = set(best_config[best_config == 1].index.tolist())
-
-        # change chose var to dict
-        var_dict_list = []
-        var_dict_raw = {}
-        for valid_var in chosen_var:
-            var_name = valid_var.split("_")[1]
-            var_angle = valid_var.split("_")[2]
-            if var_name not in var_dict_raw.keys():
-                var_dict_raw[var_name] = []
-                var_dict_raw[var_name].append(var_angle)
-            else:
-                var_dict_raw[var_name].append(var_angle)
-
-        var_diff = M - len(var_dict_raw)
-
-        var_diff_offset = 1
-        max_generate = D
-
+    def _decode_samples(self, pddf_sample):
+        # (rows, torsions, D) one-hot blocks of the sample matrix, in the
+        # order of self.valid_var_name
+        samples = pddf_sample.reindex(
+            columns=self.valid_var_angle, fill_value=0).to_numpy(dtype=np.int8)
+        return samples.reshape(len(samples), len(self.valid_var_name), self.D)
+
+    def _row_candidates(self, onehot):
+        # expand a row that breaks the one-hot constraint: every chosen angle
+        # of a torsion is tried, a single missing torsion tries all D angles
+        # and more missing torsions keep angle 1
+        max_generate = self.D
+        var_angle = [np.flatnonzero(angle).tolist() for angle in onehot]
+        var_diff = sum(len(angle) == 0 for angle in var_angle)
         if var_diff == 1:
-            candi_angle = [str(d+1) for d in range(D)]
-            for var_name in self.valid_var_name:
-                if var_name not in var_dict_raw.keys():
-                    var_dict_raw[var_name] = candi_angle
+            var_angle = [angle if len(angle) > 0 else list(
+                range(self.D)) for angle in var_angle]
         elif var_diff > 1:
-            for var_name in self.valid_var_name:
-                if var_name not in var_dict_raw.keys():
-                    var_dict_raw[var_name] = ['1']
-
-        def _update_var_dict_list(var_dict, key_list):
-            if len(var_dict_list) > max_generate:
-                return
-            key_value = str(key_list[0])
-            for angle in var_dict_raw[key_value]:
-                local_var_dict = var_dict.copy()
-                local_var_dict[key_value] = str(angle)
-                if len(key_list) == 1:
-                    var_dict_list.append(local_var_dict)
-                else:
-                    _update_var_dict_list(local_var_dict, key_list[1:])
-
-        key_list = list(var_dict_raw.keys())
-
-        _update_var_dict_list({}, key_list)
+            var_angle = [angle if len(angle) > 0 else [0]
+                         for angle in var_angle]
 
-        # use to generate final position
-        logging.info(
-            f"var_dict_raw {var_dict_raw} var_dict_list {var_dict_list}")
-
-        for var_dict in var_dict_list:
-            complete_tor_info = {}
-            max_tor_list = []
-            max_ris_num = 1
-            max_ris = None
-            actual_var = set()
-            for var, angle in var_dict.items():
-                actual_var.add(f"X_{var}_{angle}")
-            complete_tor_list = []
-
-            for ris in self.mol_data.bond_graph.sort_ris_data[str(M)].keys():
-                # ris: '30+31', '29+30', '30+31,29+30'
-                #             atom_pos_data_temp = self.atom_pos_data_raw.copy()
-                logging.debug(f"ris group {ris} ")
-                torsion_group = ris.split(",")
-                # update points
-                rb_set = self.mol_data.bond_graph.sort_ris_data[str(
-                    self.M)][ris]
-
-                tor_list = []
-                for rb_name in torsion_group:
-                    var_name = self.rb_var_map[rb_name]
-                    var_angle = var_dict[var_name]
-
-                    tor_list.append(f'X_{var_name}_{var_angle}')
-
-                logging.debug(f"theta_option {self.theta_option}")
-                logging.debug(f"rb_set {rb_set}")
-
-                complete_tor_list.append((tor_list, rb_set))
-
-                # update for final position
-                current_ris_num = len(torsion_group)
-                if current_ris_num >= max_ris_num:
-                    max_ris_num = current_ris_num
-                    max_ris = ris
-                    max_tor_list = tor_list
-
-            complete_tor_info['tor_list'] = complete_tor_list
-            complete_tor_info['chosen_var'] = chosen_var
-            complete_tor_info['actual_var'] = actual_var
-            complete_tor_info['max_tor_list'] = max_tor_list
-            complete_tor_info['max_ris'] = max_ris
-
-            generate_row.append(complete_tor_info)
-
-        return generate_row
-
-    def _evaluate_one_result(self, complete_tor_list):
-
-        optimize_volume = 0
-        raw_volume = 0
-        for tor in complete_tor_list:
-            # build map for affected tor
-            tor_list = tor[0]
-            rb_set = tor[1]
-#             print(f"tor list is {tor_list} and rb set is {rb_set}")
-            tor_map = {}
-            tor_len = len(tor_list)
-            for base_idx in range(tor_len):
-                tor_name = tor_list[base_idx]
-                tor_map[tor_name] = set()
-                base_rb_name = self.var_rb_map[tor_list[base_idx].split('_')[
-                    1]]
-
-                # get direction set
-                direction_set = get_same_direction_set(
-                    rb_set['f_1_set'], self.mol_data.bond_graph.rb_data, base_rb_name)
-
-                for candi_idx in range(base_idx, tor_len):
-                    candi_rb_name = self.var_rb_map[tor_list[candi_idx].split('_')[
-                        1]].split('+')
-                    for rb in candi_rb_name:
-                        if rb in direction_set:
-                            tor_map[tor_name].add(rb)
-
-            logging.debug(f"tor_map {tor_map}")
-
-            self._init_mol_file(self.atom_pos_data_temp)
-
-            optimize_distance = update_pts_distance(
-                self.atom_pos_data_temp, rb_set, tor_map, self.var_rb_map, self.theta_option, True, True)
-            optimize_volume = optimize_volume + optimize_distance
-
-            if self.parameters["volume"]["initial"] == 0:
-                raw_distance = update_pts_distance(
-                    self.atom_pos_data_raw, rb_set, None, None, None, False, True)
-                raw_volume = raw_volume + raw_distance
-
-        if self.parameters["volume"]["initial"] == 0:
-            self.parameters["volume"]["initial"] = raw_volume
-
-        optimize_gain = optimize_volume / \
-            self.parameters["volume"]["initial"]
-
-        logging.info(f"initial {self.parameters['volume']['initial']}")
-        logging.info(f"optimize {optimize_volume}")
-        logging.info(f"optimize_gain {optimize_gain}")
-
-        return optimize_gain, optimize_volume
+        candidates = []
+        for candidate in itertools.product(*var_angle):
+            candidates.append(candidate)
+            if len(candidates) > max_generate:
+                break
+        return candidates
+
+    def _evaluate_batch(self, angle_idx):
+        # summed ris distance of (num_candidates, torsions) angle indices
+        theta_option = np.array(self.theta_option)
+        optimize_volume = np.zeros(len(angle_idx))
+        if len(angle_idx) == 0:
+            return []
+        for ris_tor, frame in zip(self.ris_tor, self.ris_frame):
+            optimize_volume = optimize_volume + \
+                centroid_distance_batch(
+                    frame, theta_option[angle_idx[:, ris_tor]], share_prefix=True)
+        return optimize_volume.tolist()
+
+    def _chosen_var(self, onehot):
+        return set(f'x_{var_name}_{d+1}' for var_name, angle in zip(self.valid_var_name, onehot)
+                   for d in np.flatnonzero(angle).tolist())
+
+    def _candidate_var(self, candidate):
+        return set(f'X_{var_name}_{angle+1}' for var_name, angle in zip(self.valid_var_name, candidate))
+
+    def _candidate_tor_list(self, candidate):
+        return [f'X_{self.rb_var_map[rb_name]}_{candidate[self.valid_var_name.index(self.rb_var_map[rb_name])]+1}'
+                for rb_name in self.max_ris.split(",")]
 
     def _physical_check_van_der_waals(self, atom_raw):
-        check_result = True
-        for atom_index, atom_info in atom_raw.items():
-            vdw_radius = atom_info['vdw-radius']
-            atom_pos = atom_info['pts']
-            if check_result == False:
-                break
-            for non_contact_atom in self.non_contact_atom_map[atom_index]:
-                non_contact_atom_pos = atom_raw[non_contact_atom]['pts']
-                distance = calc_distance_between_pts(
-                    [atom_pos], [non_contact_atom_pos])
-#                 if non_contact_atom == '14' and atom_index == '1':
-#                       logging.info(f"fail at {atom_index} to {non_contact_atom} for distance {distance}")
-                if distance < vdw_radius:
-                    logging.info(f"fail at {atom_index} to {non_contact_atom}")
-                    check_result = False
-                    break
-
-        return check_result
+        # no atom may be closer to a non bonded atom than its vdw-radius
+        return self.clash_checker.check(self.clash_checker.pts_array(atom_raw))
 
     def save_mol_file(self, save_name):
         logging.info(f"save_mol_file {save_name}")
@@ -547,6 +512,8 @@ class ResultParser():
 
     def View3DMol(self, mol, size=(600, 600), style="stick", surface=False, opacity=0.5, type="mol2"):
         assert style in ('line', 'stick', 'sphere', 'carton')
+        # notebook only dependency, not needed in hybrid jobs
+        import py3Dmol
         viewer = py3Dmol.view(width=size[0], height=size[1])
         viewer.addModel(open(mol, 'r').read(), type)
         viewer.setStyle({style: {}})
@@ -559,6 +526,8 @@ class ResultParser():
         return self.View3DMol(mol, size=(size, size), style=style).show()
 
     def InteractView(self, mol, size):
+        from ipywidgets import interact
+        import ipywidgets
         interact(self.StyleSelector,
                  mol=mol,
                  size=size,
@@ -0,0 +1,48 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import logging
+import math
+import os
+import sys
+
+import pytest
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(TEST_DIR, "..", "hybridjobs"))
+
+from utility.MoleculeParser import MoleculeData  # noqa: E402
+from utility.QMUQUBO import QMUQUBO  # noqa: E402
+
+logging.disable(logging.INFO)
+
+# the atom path rounds every point to 4 decimals after each torsion, every
+# rounding moves a fragment centroid by at most sqrt(3)*0.5e-4
+ROUNDING_PER_STEP = 2 * math.sqrt(3) * 0.5e-4
+
+
+@pytest.fixture(scope="module")
+def qmu_qubo():
+    mol_data = MoleculeData(os.path.join(
+        TEST_DIR, "..", "molecular-unfolding-data", "117_ideal.mol2"), 'qmu')
+    return QMUQUBO(mol_data, ['pre-calc'], **{'pre-calc': {'param': ['M', 'D', 'A', 'hubo_qubo_val']}})
+
+
+def _hubo_distances(qmu_qubo, M, D, distance_method):
+    var, var_rb_map, rb_var_map = qmu_qubo._prepare_var(qmu_qubo.mol_data, D)
+    theta_option = [x * 360/D for x in range(D)]
+    _, hubo_distances = qmu_qubo._build_qubo_pre_calc(qmu_qubo.mol_data, M, D, 1, var, rb_var_map,
+                                                      var_rb_map, theta_option, distance_method)
+    return hubo_distances
+
+
+@pytest.mark.parametrize("M,D", [(1, 4), (2, 4), (3, 4), (4, 4), (2, 8), (3, 8)])
+def test_centroid_distance_matches_atom(qmu_qubo, M, D):
+    atom_distances = _hubo_distances(qmu_qubo, M, D, "atom")
+    centroid_distances = _hubo_distances(qmu_qubo, M, D, "centroid")
+
+    assert len(atom_distances) > 0
+    assert centroid_distances.keys() == atom_distances.keys()
+    for key, atom_distance in atom_distances.items():
+        assert centroid_distances[key] == pytest.approx(
+            atom_distance, abs=M*ROUNDING_PER_STEP)
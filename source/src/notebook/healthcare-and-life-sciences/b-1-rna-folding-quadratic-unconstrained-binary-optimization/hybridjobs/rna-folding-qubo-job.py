@@ -7,7 +7,6 @@
 
 
 import logging
-import boto3
 import json
 import os
 import sys
@@ -20,11 +19,6 @@ from utility.RNAQUBO import RNAQUBO
 from utility.AnnealerOptimizer import Annealer
 from utility.ResultProcess import ResultParser
 
-from braket.aws import AwsDevice
-from braket.jobs import save_job_result
-from braket.jobs.metrics import log_metric
-from braket.tracking import Tracker
-
 import time
 
 logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s',
@@ -32,6 +26,10 @@ logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s [%(filename)s:
                     level=logging.INFO)
 
 def main():
+    # braket is only needed once the job runs, importing this script stays cheap
+    from braket.jobs import save_job_result
+    from braket.tracking import Tracker
+
     t = Tracker().start()
     
     input_dir = os.environ["AMZN_BRAKET_INPUT_DIR"]
@@ -101,6 +99,10 @@ def _build_model(data_path, mol_data, hyperparameters):
     model_param[method]["PKP"] = [float(hyperparameters["PKP"])]
     model_param[method]["S"] = [int(hyperparameters["S"])]
     model_param[method]["O"] = [int(float(hyperparameters["O"]))]
+    # optional stem pruning, bounds the number of QUBO variables
+    for key, cast in [("min_length", int), ("max_loop", int), ("min_energy", float), ("top_k", int)]:
+        if key in hyperparameters:
+            model_param[method][key] = cast(hyperparameters[key])
 
     rna_qubo.build_models(**model_param)
     # describe the model parameters
@@ -128,6 +130,8 @@ def _optimize(model_path, target_name, hyperparameters):
 
     optimizer_param = {}
     optimizer_param['shots'] = int(hyperparameters['shots'])
+    # the post process below reads the memory-mapped arrays, only the top rows are unpacked
+    optimizer_param['result_format'] = hyperparameters.get('result_format', 'array')
 
     sa_optimizer = Annealer(qubo_model, method, **optimizer_param)
 
@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the local disk cache of minor embeddings for quantum annealers
+########################################################################################################################
+import dimod
+
+import hashlib
+import json
+import time
+import os
+import logging
+
+from .SparseQUBO import SparseQUBO
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class EmbeddingCache():
+    # The embedding only depends on the interaction graph of the model and the
+    # qubits/couplers of the annealer, so models that only differ in their
+    # coefficients (e.g. a sweep over A/hubo_qubo_val) share one cache entry.
+    # Every entry is a json file {variable: [qubits]} named by the sha256 of
+    # the source graph and the target topology.
+
+    def __init__(self, cache_dir="./embedding_cache"):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def source_edgelist(qubo):
+        # interactions of the model plus (v, v) for every variable,
+        # same as EmbeddingComposite so isolated variables get a chain too
+        if isinstance(qubo, SparseQUBO):
+            edges = [(qubo.labels[u], qubo.labels[v])
+                     for u, v in zip(qubo.row.tolist(), qubo.col.tolist())]
+            variables = qubo.labels
+        elif isinstance(qubo, dimod.BinaryQuadraticModel):
+            edges = list(qubo.quadratic.keys())
+            variables = list(qubo.variables)
+        else:
+            edges = [(u, v) for u, v in qubo.keys() if u != v]
+            variables = []
+            for u, v in qubo.keys():
+                variables.append(u)
+                variables.append(v)
+        return edges + [(v, v) for v in dict.fromkeys(variables)]
+
+    @staticmethod
+    def key(source_edgelist, target_edgelist, topology=None):
+        source = sorted(set(tuple(sorted((str(u), str(v))))
+                            for u, v in source_edgelist))
+        target = sorted(set(tuple(sorted((int(u), int(v))))
+                            for u, v in target_edgelist))
+        graph_str = json.dumps(
+            {"source": source, "target": target, "topology": topology}, sort_keys=True)
+        return hashlib.sha256(graph_str.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"embedding_{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def save(self, key, embedding):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        with open(path, "w") as f:
+            json.dump({str(v): [int(q) for q in chain]
+                      for v, chain in embedding.items()}, f)
+        logging.info(f"save embedding to {path}")
+        return path
+
+    def find_embedding(self, qubo, target_sampler, **embed_param):
+        # return the embedding of qubo on target_sampler (any dimod.Structured
+        # sampler) and whether it came from the cache
+        source_edgelist = self.source_edgelist(qubo)
+        target_edgelist = target_sampler.edgelist
+        topology = target_sampler.properties.get("topology")
+        key = self.key(source_edgelist, target_edgelist, topology)
+
+        label_map = {}
+        for u, v in source_edgelist:
+            label_map[str(u)] = u
+            label_map[str(v)] = v
+
+        cached = self.get(key)
+        if cached is not None and set(cached.keys()) == set(label_map.keys()):
+            logging.info(f"embedding cache hit {key}")
+            return {label_map[v]: chain for v, chain in cached.items()}, True
+
+        logging.info(f"embedding cache miss {key}, find embedding")
+        import minorminer
+        start = time.time()
+        embedding = minorminer.find_embedding(
+            source_edgelist, target_edgelist, **embed_param)
+        end = time.time()
+        if len(source_edgelist) > 0 and len(embedding) == 0:
+            raise Exception("no embedding found for the model!")
+        logging.info(f"find embedding in {end-start} s")
+        self.save(key, embedding)
+        return dict(embedding), False
@@ -0,0 +1,330 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the numpy simulated annealer running many replicas at once
+########################################################################################################################
+import dimod
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import time
+import logging
+
+from .SparseQUBO import SparseQUBO
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class NumpySimulatedAnnealingSampler():
+    # Single spin flip Metropolis annealing over all the reads at once.
+    # The variables are greedily colored so that no two variables of a color
+    # interact, and every color is updated for all the replicas in one numpy step.
+    # The couplings are kept as a dense matrix for small models (n <= dense_limit)
+    # and as symmetric CSR arrays otherwise. The reads are split across workers,
+    # every worker receives the SparseQUBO once and builds its own arrays.
+
+    def __init__(self, workers=1, dense_limit=4096):
+        self.workers = workers
+        self.dense_limit = dense_limit
+
+    def sample(self, qubo, num_reads=100, num_sweeps=1000, beta_range=None, seed=None):
+        start = time.time()
+        if isinstance(qubo, SparseQUBO):
+            sparse_qubo = qubo
+        elif isinstance(qubo, dimod.BinaryQuadraticModel):
+            sparse_qubo = SparseQUBO.from_bqm(qubo)
+        else:
+            sparse_qubo = SparseQUBO.from_dict(qubo)
+
+        model = self._build_arrays(sparse_qubo)
+        if beta_range is None:
+            beta_range = self._default_beta_range(model)
+        betas = np.geomspace(beta_range[0], beta_range[1], num_sweeps)
+
+        workers = max(1, min(self.workers, num_reads))
+        read_list = [len(reads) for reads in np.array_split(
+            np.arange(num_reads), workers)]
+        seed_list = np.random.SeedSequence(seed).spawn(workers)
+        if workers > 1:
+            logging.info(
+                f"numpy sa with {num_reads} reads on {workers} workers")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self, sparse_qubo)) as executor:
+                sample_list = list(executor.map(
+                    _anneal_worker, read_list, [betas]*workers, seed_list))
+        else:
+            sample_list = [anneal(model, num_reads, betas, seed_list[0])]
+
+        samples = np.concatenate(sample_list, axis=0)
+        energies = sparse_qubo.energies(samples)
+        end = time.time()
+        logging.info(
+            f"numpy sa sampled {num_reads} reads with {num_sweeps} sweeps in {end-start} s")
+
+        return dimod.SampleSet.from_samples((samples, sparse_qubo.labels), dimod.BINARY, energies,
+                                            info={"beta_range": tuple(beta_range), "num_sweeps": num_sweeps})
+
+    def _build_arrays(self, sparse_qubo):
+        n = sparse_qubo.num_variables
+        # symmetric CSR of the couplings, duplicated (u, v)/(v, u) entries are summed
+        row = np.concatenate([sparse_qubo.row, sparse_qubo.col])
+        col = np.concatenate([sparse_qubo.col, sparse_qubo.row])
+        key, inverse = np.unique(row * n + col, return_inverse=True)
+        data = np.zeros(len(key), dtype=float)
+        np.add.at(data, inverse.ravel(), np.concatenate(
+            [sparse_qubo.quad, sparse_qubo.quad]))
+        indices = key % n
+        indptr = np.searchsorted(key // n, np.arange(n + 1))
+
+        # greedy coloring, the variables with the most neighbors first
+        degree = np.diff(indptr)
+        color = np.full(n, -1, dtype=np.int64)
+        for v in np.argsort(-degree, kind='stable').tolist():
+            used = set(color[indices[indptr[v]:indptr[v+1]]].tolist())
+            c = 0
+            while c in used:
+                c = c + 1
+            color[v] = c
+
+        model = {}
+        model['num_variables'] = n
+        model['linear'] = sparse_qubo.linear
+        model['indptr'] = indptr
+        model['indices'] = indices
+        model['data'] = data
+        model['colors'] = []
+        dense = None
+        if n <= self.dense_limit:
+            dense = np.zeros((n, n), dtype=float)
+            dense[np.repeat(np.arange(n), degree), indices] = data
+        for c in range(color.max() + 1 if n > 0 else 0):
+            var_idx = np.nonzero(color == c)[0]
+            color_data = {'var': var_idx}
+            if dense is not None:
+                color_data['dense'] = np.ascontiguousarray(dense[:, var_idx])
+            else:
+                # edges of the color sorted by target variable for reduceat
+                local = np.repeat(np.arange(len(var_idx)), degree[var_idx])
+                target = np.concatenate(
+                    [indices[indptr[v]:indptr[v+1]] for v in var_idx])
+                value = np.concatenate(
+                    [data[indptr[v]:indptr[v+1]] for v in var_idx])
+                order = np.argsort(target, kind='stable')
+                target_idx, target_start = np.unique(
+                    target[order], return_index=True)
+                color_data['local'] = local[order]
+                color_data['value'] = value[order]
+                color_data['target'] = target_idx
+                color_data['target_start'] = target_start
+            model['colors'].append(color_data)
+        return model
+
+    def _default_beta_range(self, model):
+        # same idea as neal: the hottest beta flips the variable with the largest
+        # energy change with probability 1/2, the coldest one the smallest with 1/100
+        n = model['num_variables']
+        abs_field = np.abs(model['linear']).copy()
+        np.add.at(abs_field, np.repeat(np.arange(n), np.diff(
+            model['indptr'])), np.abs(model['data']))
+        coef = np.concatenate([np.abs(model['linear']), np.abs(model['data'])])
+        coef = coef[coef > 1e-9]
+        if len(coef) == 0:
+            return (0.1, 10.0)
+        return (np.log(2)/abs_field.max(), np.log(100)/coef.min())
+
+
+# arrays of the worker process, set once by _init_worker
+_worker_model = None
+
+
+def _init_worker(sampler, sparse_qubo):
+    # the sparse form is much smaller than the dense color slices, so every
+    # worker rebuilds the arrays instead of receiving them with each task
+    global _worker_model
+    _worker_model = sampler._build_arrays(sparse_qubo)
+
+
+def _anneal_worker(num_reads, betas, seed):
+    return anneal(_worker_model, num_reads, betas, seed)
+
+
+def _temper_worker(*args):
+    return temper(_worker_model, *args)
+
+
+def _update_field(field, color_data, flip):
+    # field += J[:, color vars] @ flip, the replicas are the last axis
+    if 'dense' in color_data:
+        field += color_data['dense'] @ flip
+    elif len(color_data['target']) > 0:
+        contrib = flip[color_data['local']] * color_data['value'][:, np.newaxis]
+        field[color_data['target']] += np.add.reduceat(
+            contrib, color_data['target_start'], axis=0)
+
+
+def _init_state(model, num_columns, rng):
+    n = model['num_variables']
+    x = rng.integers(2, size=(n, num_columns)).astype(float)
+    # local field, energy change of flipping x_i is (1-2x_i)*field_i
+    field = np.tile(model['linear'][:, np.newaxis], (1, num_columns))
+    for color_data in model['colors']:
+        _update_field(field, color_data, x[color_data['var']])
+    return x, field
+
+
+def _sweep(model, x, field, beta, rng, energy=None):
+    # one Metropolis sweep of every column, beta is a number or one per column,
+    # the energy of every column is updated in place if given
+    for color_data in model['colors']:
+        var_idx = color_data['var']
+        direction = 1 - 2 * x[var_idx]
+        delta = direction * field[var_idx]
+        accept = rng.random(delta.shape) < np.exp(
+            -beta * np.maximum(delta, 0))
+        flip = np.where(accept, direction, 0.0)
+        x[var_idx] += flip
+        if energy is not None:
+            energy += np.where(accept, delta, 0.0).sum(axis=0)
+        _update_field(field, color_data, flip)
+
+
+def anneal(model, num_reads, betas, seed):
+    # anneal num_reads replicas, returns (num_reads, num_variables) int8 samples
+    rng = np.random.default_rng(seed)
+    x, field = _init_state(model, num_reads, rng)
+
+    for beta in betas:
+        _sweep(model, x, field, beta, rng)
+
+    return x.T.astype(np.int8)
+
+
+class NumpyParallelTemperingSampler(NumpySimulatedAnnealingSampler):
+    # Replica exchange: every read is a chain of num_replicas copies held at the
+    # betas of a ladder (geometric over beta_range unless betas is given).
+    # After every swap_interval sweeps, neighbor temperatures of the ladder try
+    # to swap their states, alternating even and odd pairs. A read returns the
+    # lowest energy state seen by its chain.
+
+    def __init__(self, workers=1, dense_limit=4096, num_replicas=16, swap_interval=1):
+        super().__init__(workers, dense_limit)
+        self.num_replicas = num_replicas
+        self.swap_interval = swap_interval
+
+    def sample(self, qubo, num_reads=100, num_sweeps=1000, beta_range=None, betas=None, target_energy=None, seed=None):
+        start = time.time()
+        if isinstance(qubo, SparseQUBO):
+            sparse_qubo = qubo
+        elif isinstance(qubo, dimod.BinaryQuadraticModel):
+            sparse_qubo = SparseQUBO.from_bqm(qubo)
+        else:
+            sparse_qubo = SparseQUBO.from_dict(qubo)
+
+        model = self._build_arrays(sparse_qubo)
+        if betas is None:
+            if beta_range is None:
+                beta_range = self._default_beta_range(model)
+            betas = np.geomspace(
+                beta_range[0], beta_range[1], self.num_replicas)
+        betas = np.sort(np.asarray(betas, dtype=float))
+        # the chains track energies without the offset
+        chain_target = None if target_energy is None else target_energy - sparse_qubo.offset
+
+        workers = max(1, min(self.workers, num_reads))
+        read_list = [len(reads) for reads in np.array_split(
+            np.arange(num_reads), workers)]
+        seed_list = np.random.SeedSequence(seed).spawn(workers)
+        args = [read_list, [betas]*workers, [num_sweeps]*workers,
+                [self.swap_interval]*workers, [chain_target]*workers, seed_list]
+        if workers > 1:
+            logging.info(
+                f"numpy pt with {num_reads} reads on {workers} workers")
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self, sparse_qubo)) as executor:
+                chain_list = list(executor.map(_temper_worker, *args))
+        else:
+            chain_list = [temper(model, *[arg[0] for arg in args])]
+
+        samples = np.concatenate([chain['samples']
+                                 for chain in chain_list], axis=0)
+        energies = sparse_qubo.energies(samples)
+        swap_attempt = sum(chain['swap_attempt'] for chain in chain_list)
+        swap_accept = sum(chain['swap_accept'] for chain in chain_list)
+        swap_rate = swap_accept / np.maximum(swap_attempt, 1)
+        end = time.time()
+        logging.info(
+            f"numpy pt sampled {num_reads} reads with {len(betas)} replicas and {num_sweeps} sweeps in {end-start} s")
+        logging.info(f"numpy pt swap rate {np.round(swap_rate, 3).tolist()}")
+
+        info = {}
+        info["betas"] = betas.tolist()
+        info["num_sweeps"] = num_sweeps
+        info["swap_rate"] = swap_rate.tolist()
+        if target_energy is not None:
+            # wall time and sweeps until each chain first reached target_energy, nan if never
+            info["target_energy"] = target_energy
+            info["time_to_target"] = np.concatenate(
+                [chain['hit_time'] for chain in chain_list]).tolist()
+            info["sweeps_to_target"] = np.concatenate(
+                [chain['hit_sweep'] for chain in chain_list]).tolist()
+
+        return dimod.SampleSet.from_samples((samples, sparse_qubo.labels), dimod.BINARY, energies, info=info)
+
+
+def temper(model, num_reads, betas, num_sweeps, swap_interval, target_energy, seed):
+    # replica exchange of num_reads chains, column read*R+j holds replica j of a read,
+    # col_of[read, k] is the column at temperature k
+    start = time.time()
+    rng = np.random.default_rng(seed)
+    num_replicas = len(betas)
+    x, field = _init_state(model, num_reads*num_replicas, rng)
+    energy = 0.5 * np.sum(x * (model['linear'][:, np.newaxis] + field), axis=0)
+    col_of = np.arange(num_reads*num_replicas).reshape(num_reads, num_replicas)
+    temp = np.tile(np.arange(num_replicas), num_reads)
+    read_offset = np.arange(num_reads) * num_replicas
+
+    best_energy = np.full(num_reads, np.inf)
+    best_x = np.zeros((model['num_variables'], num_reads))
+    hit_time = np.full(num_reads, np.nan)
+    hit_sweep = np.full(num_reads, np.nan)
+    swap_attempt = np.zeros(max(num_replicas-1, 0))
+    swap_accept = np.zeros(max(num_replicas-1, 0))
+
+    for sweep in range(num_sweeps):
+        _sweep(model, x, field, betas[temp], rng, energy)
+
+        read_energy = energy.reshape(num_reads, num_replicas)
+        best_replica = np.argmin(read_energy, axis=1)
+        min_energy = read_energy[np.arange(num_reads), best_replica]
+        improved = min_energy < best_energy
+        if improved.any():
+            best_energy[improved] = min_energy[improved]
+            best_x[:, improved] = x[:, read_offset[improved] +
+                                    best_replica[improved]]
+        if target_energy is not None:
+            hit = np.isnan(hit_time) & (best_energy <= target_energy + 1e-6)
+            hit_time[hit] = time.time() - start
+            hit_sweep[hit] = sweep + 1
+
+        if num_replicas > 1 and (sweep + 1) % swap_interval == 0:
+            parity = (sweep // swap_interval) % 2
+            k = np.arange(parity, num_replicas-1, 2)
+            col_a = col_of[:, k]
+            col_b = col_of[:, k+1]
+            log_p = (betas[k+1] - betas[k]) * (energy[col_b] - energy[col_a])
+            accept = rng.random(log_p.shape) < np.exp(np.minimum(log_p, 0))
+            swap_attempt[k] += num_reads
+            swap_accept[k] += accept.sum(axis=0)
+            col_of[:, k] = np.where(accept, col_b, col_a)
+            col_of[:, k+1] = np.where(accept, col_a, col_b)
+            temp[col_of] = np.arange(num_replicas)[np.newaxis, :]
+
+    chain = {}
+    chain['samples'] = best_x.T.astype(np.int8)
+    chain['hit_time'] = hit_time
+    chain['hit_sweep'] = hit_sweep
+    chain['swap_attempt'] = swap_attempt
+    chain['swap_accept'] = swap_accept
+    return chain
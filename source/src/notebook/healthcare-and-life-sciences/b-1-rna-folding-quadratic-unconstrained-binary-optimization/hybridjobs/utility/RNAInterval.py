@@ -0,0 +1,91 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following functions compute the overlap and pseudoknot relations of stem pairs with numpy intervals
+########################################################################################################################
+import numpy as np
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class StemInterval():
+    # stems_potential [[i, j, energy, length], ...] (or the [[i, j, energy], ...]
+    # actual stems of ResultProcess) as arrays, every stem
+    # covers the 5' side [start_5, end_5] and the 3' side [start_3, end_3]
+    # (inclusive). As in RNAQUBO._potential_overlaps the span of both sides is
+    # the third column, int(stem[2]).
+
+    def __init__(self, stems_potential, span_col=2):
+        stems = np.asarray(stems_potential, dtype=float)
+        if len(stems) == 0:
+            stems = np.zeros((0, 3), dtype=float)
+        self.num_stems = len(stems)
+        self.i = stems[:, 0].astype(np.int64)
+        self.j = stems[:, 1].astype(np.int64)
+        span = stems[:, span_col].astype(np.int64)
+        self.start_5 = self.i
+        self.end_5 = self.i + span - 1
+        self.start_3 = self.j - span + 1
+        self.end_3 = self.j
+
+    def _blocks(self, block_size):
+        for begin in range(0, self.num_stems, block_size):
+            yield begin, min(begin+block_size, self.num_stems)
+
+    def _upper_pairs(self, relation, block_size):
+        # relation(rows, cols) -> (len(rows), len(cols)) bool, evaluated by row
+        # blocks so the S x S table is never materialized
+        pair_i = []
+        pair_j = []
+        cols = np.arange(self.num_stems)
+        for begin, end in self._blocks(block_size):
+            rows = np.arange(begin, end)
+            mask = relation(rows[:, np.newaxis], cols[np.newaxis, :])
+            mask &= rows[:, np.newaxis] < cols[np.newaxis, :]
+            block_i, block_j = np.nonzero(mask)
+            pair_i.append(block_i + begin)
+            pair_j.append(block_j)
+        if len(pair_i) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(pair_i).astype(np.int64), np.concatenate(pair_j).astype(np.int64)
+
+    def overlap_pairs(self, block_size=1024):
+        # (a, b) with a < b where any side of stem a intersects any side of stem b
+        def _intersect(start_a, end_a, start_b, end_b):
+            return (start_a <= end_b) & (start_b <= end_a)
+
+        def _relation(a, b):
+            sides = [(self.start_5, self.end_5), (self.start_3, self.end_3)]
+            mask = np.zeros((a.shape[0], b.shape[1]), dtype=bool)
+            for start_a, end_a in sides:
+                for start_b, end_b in sides:
+                    mask |= _intersect(start_a[a], end_a[a],
+                                       start_b[b], end_b[b])
+            return mask
+
+        return self._upper_pairs(_relation, block_size)
+
+    def pseudoknot_pairs(self, block_size=1024):
+        # (a, b) with a < b where i_a < i_b < j_a < j_b
+        def _relation(a, b):
+            return (self.i[a] < self.i[b]) & (self.i[b] < self.j[a]) & (self.j[a] < self.j[b])
+
+        return self._upper_pairs(_relation, block_size)
+
+
+def pair_position(pair_i, pair_j, num_stems):
+    # position of (i, j), i < j, in the row major order of all stem pairs
+    return pair_i*num_stems - pair_i*(pair_i+1)//2 + pair_j - pair_i - 1
+
+
+def dense_pair_list(pair_i, pair_j, num_stems, value, default):
+    # [[i, j, value or default], ...] for all i < j, the list format of
+    # potential_pseudoknots and RNAQUBO._potential_overlaps
+    all_i, all_j = np.triu_indices(num_stems, 1)
+    values = [default]*len(all_i)
+    for position in pair_position(pair_i, pair_j, num_stems).tolist():
+        values[position] = value
+    return [[i, j, v] for i, j, v in zip(all_i.tolist(), all_j.tolist(), values)]
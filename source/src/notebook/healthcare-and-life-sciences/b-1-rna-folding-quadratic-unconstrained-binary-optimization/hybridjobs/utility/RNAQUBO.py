@@ -14,7 +14,10 @@ import pickle  # nosec
 import os
 
 from .RNAParser import RNAData
+from .SparseQUBO import SparseQUBO
 from .RNAGeoCalc import *
+from .RNAInterval import StemInterval, pair_position
+from .RNAStem import prune_stems
 
 log = logging.getLogger()
 log.setLevel('INFO')
@@ -58,8 +61,31 @@ class RNAQUBO():
             return 0
         
     def _build_qc_models(self, **model_param):
+        # "dict": defaultdict keyed by variable names, "sparse": SparseQUBO arrays.
+        # Every stem pair is coupled, so both hold all S*(S-1)/2 pairs, "sparse"
+        # only stores them as arrays instead of a dict entry per pair
+        qubo_format = model_param.get("qubo_format", "dict")
+        # stems shorter than short_length pairs get the short stem penalty S
+        short_length = model_param.get("short_length", 4)
+        # stem pruning, bounds the number of variables, see RNAStem.prune_stems
+        prune_param = {"min_length": model_param.get("min_length", 3),
+                       "max_loop": model_param.get("max_loop", None),
+                       "min_energy": model_param.get("min_energy", None),
+                       "top_k": model_param.get("top_k", None)}
 
         for rna_name in self.models:
+            # the stems, pair couplings, overlaps and pseudoknots do not depend on
+            # PKP, O and S, every model of the sweep rescales the same arrays
+            start = time.time()
+            stems_p = self.rna_data[rna_name]['potential_stems']
+            stem_index = prune_stems(stems_p[0], **prune_param)
+            structure = self._stem_structure(
+                [stems_p[0][idx] for idx in stem_index], stems_p[1], short_length)
+            # the variable of a stem is its index in potential_stems
+            structure['labels'] = [str(idx) for idx in stem_index.tolist()]
+            logging.info(
+                f"stem structure of {rna_name}: {structure['num_stems']} of {len(stems_p[0])} stems, {len(structure['row'])} pairs, {time.time()-start} s")
+
             for pkp_penalty in model_param["PKP"]:
                 for overlap_penalty in model_param["O"]:
                     for short_penalty in model_param["S"]:
@@ -76,18 +102,22 @@ class RNAQUBO():
 
 
                         start = time.time()
-                        stems_p = self.rna_data[rna_name]['potential_stems']
-                        pks_p = potential_pseudoknots(stems_p[0], pkp_penalty)
-                        ols_p = self._potential_overlaps(stems_p[0])
-                        qubo_data = self._model(stems_p[0], pks_p, ols_p, stems_p[1])
-                        qubo_raw = dimod.BinaryQuadraticModel(qubo_data[0], qubo_data[1], vartype = 'BINARY')
-                        qubo = self._manual_qubo(qubo_raw.to_qubo())
+                        qubo_data = self._model_vectors(
+                            structure, pkp_penalty, overlap_penalty, short_penalty)
+                        if qubo_format == "sparse":
+                            qubo = self._sparse_qubo(structure['labels'], qubo_data)
+                        else:
+                            qubo = self._manual_qubo(self._bqm(structure['labels'], qubo_data).to_qubo())
                         end = time.time()
+                        logging.info(
+                            f"model {model_name}: {len(qubo_data[0])} variables, {len(qubo_data[3])} interactions")
 
                         self.models[rna_name]['model_qubo']["qc"][model_name] = {}
                         self.models[rna_name]['model_qubo']["qc"][model_name]["qubo"] = qubo
                         self.models[rna_name]['model_qubo']["qc"][model_name]["time"] = end-start
                         self.models[rna_name]['model_qubo']["qc"][model_name]["model_name"] = model_name
+                        self.models[rna_name]['model_qubo']["qc"][model_name]["num_variables"] = len(qubo_data[0])
+                        self.models[rna_name]['model_qubo']["qc"][model_name]["num_interactions"] = len(qubo_data[3])
     #                 
     #                 # # optimize results
     #                 # self.model_qubo["pre-calc"][model_name]["optimizer"] = {}
@@ -104,6 +134,19 @@ class RNAQUBO():
 
         return qubo
 
+    def _sparse_qubo(self, labels, qubo_data):
+        # same terms as _manual_qubo, straight from the arrays of _model_vectors
+        linear, row, col, quad = qubo_data
+        qubo = SparseQUBO(labels, linear, row, col, quad)
+
+        return qubo
+
+    def _bqm(self, labels, qubo_data):
+        # one vectorized call instead of a dict entry per stem pair
+        linear, row, col, quad = qubo_data
+        return dimod.BinaryQuadraticModel.from_numpy_vectors(
+            linear, (row, col, quad), 0.0, dimod.BINARY, variable_order=labels)
+
     def describe_models(self):
 
         # information for model
@@ -148,52 +191,52 @@ class RNAQUBO():
     # function to generate list of stem pairs that overlap:
 
     def _potential_overlaps(self, stems_potential):
-        
-        overlaps_potential = []
-        overlap_penalty = 1e6
-
-        for i in range(len(stems_potential)):
-            for j in range(i+1, len(stems_potential)):
-        
-                stem1 = stems_potential[i]
-                stem2 = stems_potential[j]
-        
-                overlap = [i, j, 0]
-        
-                stem1_cspan1 = set(range(stem1[1]-int(stem1[2])+1, stem1[1]+1))
-                stem2_cspan1 = set(range(stem2[1]-int(stem2[2])+1, stem2[1]+1))
-                
-                stem1_cspan2 = set(range(stem1[0], stem1[0]+int(stem1[2])))
-                stem2_cspan2 = set(range(stem2[0], stem2[0]+int(stem2[2])))
-
-                # stem1_cspan1 = set(range(stem1[1]-int(stem1[3])+1, stem1[1]+1))
-                # stem2_cspan1 = set(range(stem2[1]-int(stem2[3])+1, stem2[1]+1))
-                
-                # stem1_cspan2 = set(range(stem1[0], stem1[0]+int(stem1[3])))
-                # stem2_cspan2 = set(range(stem2[0], stem2[0]+int(stem2[3])))
-        
-                if (len(stem1_cspan1 & stem2_cspan1) != 0) or (len(stem1_cspan2 & stem2_cspan2) != 0)  or (len(stem1_cspan1 & stem2_cspan2) != 0) or (len(stem1_cspan2 & stem2_cspan1) != 0):
-            
-                    overlap[2] = overlap_penalty
-            
-                overlaps_potential.append(overlap)
-                
-        return overlaps_potential
+        # (pair_i, pair_j) index arrays of the overlapping stem pairs, i < j,
+        # from broadcast interval comparisons, see RNAInterval
+        stem_interval = StemInterval(stems_potential)
+        return stem_interval.overlap_pairs()
 
     # function to generate the Hamiltonian of a given RNA structure from potential stems, overlaps, and pseudoknots:
 
-    def _model(self, stems_potential, pseudoknots_potential, overlaps_potential, mu):
-        
-        L = {}
-        Q = {}
+    def _stem_structure(self, stems_potential, mu, short_length):
+        # the parts of the Hamiltonian that do not depend on the penalties
+        # linear: one coefficient per stem
+        # row/col/coupling: -2*cb*e_i*e_j of every stem pair i < j. The stem
+        # energies are positive, so no coupling is zero and the coupling
+        # matrix is dense, S*(S-1)/2 pairs for S stems
+        # pseudoknot/overlap: positions of the pseudoknot/overlapping pairs in row/col
+        # short: pairs missing to short_length of every stem
         cl = 1
         cb = 1
-        k = 0
 
-        for i in range(0, len(stems_potential)):
-            L[str(i)] = cl*((stems_potential[i][2]**2)-2*mu*stems_potential[i][2]+mu**2)-cb*(stems_potential[i][2]**2)
-            for j in range(i+1, len(stems_potential)):
-                Q[(str(i), str(j))] = -2*cb*stems_potential[i][2]*stems_potential[j][2]*pseudoknots_potential[k][2]+overlaps_potential[k][2]
-                k += 1
-        
-        return L, Q
+        num_stems = len(stems_potential)
+        stem_interval = StemInterval(stems_potential)
+        energy = np.array([stem[2] for stem in stems_potential], dtype=float)
+        length = np.array([stem[3] for stem in stems_potential], dtype=float)
+
+        row, col = np.triu_indices(num_stems, 1)
+        structure = {}
+        structure['num_stems'] = num_stems
+        structure['linear'] = cl*((energy**2)-2*mu*energy+mu**2)-cb*(energy**2)
+        structure['short'] = np.maximum(short_length-length, 0)
+        structure['row'] = row
+        structure['col'] = col
+        structure['coupling'] = -2*cb*energy[row]*energy[col]
+        structure['pseudoknot'] = pair_position(
+            *stem_interval.pseudoknot_pairs(), num_stems)
+        structure['overlap'] = pair_position(
+            *self._potential_overlaps(stems_potential), num_stems)
+        return structure
+
+    def _model_vectors(self, structure, pkp, overlap_penalty, short_penalty):
+        # linear: stem coefficients plus S for every pair a stem is short of short_length
+        # row/col/quad: the couplings, -2*cb*e_i*e_j (times pkp for a
+        # pseudoknot) plus O for an overlap. Only a pair where the overlap
+        # penalty cancels the coupling is dropped, the model stays dense
+        linear = structure['linear'] + short_penalty*structure['short']
+
+        quad = structure['coupling'].copy()
+        quad[structure['pseudoknot']] *= pkp
+        quad[structure['overlap']] += overlap_penalty
+        nonzero = np.flatnonzero(quad)
+        return linear, structure['row'][nonzero], structure['col'][nonzero], quad[nonzero]
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following functions enumerate the potential stems of an RNA sequence with numpy
+########################################################################################################################
+import numpy as np
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+# base -> code, every other character (e.g. the new line of the fasta line) is 0 and never pairs
+BASE_CODE = {'A': 1, 'C': 2, 'G': 3, 'U': 4}
+
+# PAIR_ENERGY[code_1, code_2]: 3 for G-C, 2 for A-U and the G-U wobble, 0 for no pair
+PAIR_ENERGY = np.zeros((5, 5), dtype=np.uint8)
+for base_1, base_2, energy in [('G', 'C', 3), ('A', 'U', 2), ('G', 'U', 2)]:
+    PAIR_ENERGY[BASE_CODE[base_1], BASE_CODE[base_2]] = energy
+    PAIR_ENERGY[BASE_CODE[base_2], BASE_CODE[base_1]] = energy
+
+
+def encode_rna(rna_strand):
+    # rna string -> uint8 codes, lower case bases are the same as upper case
+    lookup = np.zeros(256, dtype=np.uint8)
+    for base, code in BASE_CODE.items():
+        lookup[ord(base)] = code
+        lookup[ord(base.lower())] = code
+    raw = np.frombuffer(rna_strand.encode('ascii', 'replace'), dtype=np.uint8)
+    return lookup[raw]
+
+
+def pairing_matrix(codes):
+    # (L, L) pair energy of base i with base j, only i < j is kept
+    return np.triu(PAIR_ENERGY[codes[:, np.newaxis], codes[np.newaxis, :]], 1)
+
+
+def stem_runs(matrix):
+    # A stem starting at (i, j) pairs (i+k, j-k), so stems lie on the
+    # anti-diagonals i+j = const. The nonzero entries are sorted by anti-diagonal
+    # and row, a run ends where the anti-diagonal changes or the row jumps.
+    # return: rows and cols of the nonzero entries in row major order,
+    # the number of pairs from every entry to the end of its run, and the
+    # energy prefix sum along the runs (in run order) with the run position of
+    # every entry
+    rows, cols = np.nonzero(matrix)
+    energy = matrix[rows, cols].astype(np.int64)
+    diag = rows + cols
+    order = np.lexsort((rows, diag))
+
+    diag_sorted = diag[order]
+    rows_sorted = rows[order]
+    new_run = np.ones(len(order), dtype=bool)
+    new_run[1:] = (diag_sorted[1:] != diag_sorted[:-1]) | (
+        rows_sorted[1:] != rows_sorted[:-1]+1)
+    run_start = np.flatnonzero(new_run)
+    run_end = np.append(run_start[1:], len(order))
+    run_id = np.cumsum(new_run) - 1
+
+    # position in run order of every entry in row major order
+    run_pos = np.empty(len(order), dtype=np.int64)
+    run_pos[order] = np.arange(len(order))
+    remain = run_end[run_id][run_pos] - run_pos
+
+    prefix = np.zeros(len(order)+1, dtype=np.int64)
+    prefix[1:] = np.cumsum(energy[order])
+    return rows, cols, remain, prefix, run_pos
+
+
+def potential_stems(rna_strand, min_length=3):
+    # Every maximal run of pairs on an anti-diagonal and all its sub-stems that
+    # are at least min_length pairs long and start anywhere in the run.
+    # return: [stems_potential, mu, rna, len(rna)], with stems_potential a list
+    # of [i, j, energy, length] (1-based i < j) ordered by i, j and length, and mu
+    # the largest energy of a maximal run
+    codes = encode_rna(rna_strand)
+    matrix = pairing_matrix(codes)
+    rows, cols, remain, prefix, run_pos = stem_runs(matrix)
+
+    mu = float(np.max(prefix[run_pos+remain] - prefix[run_pos])) if len(rows) > 0 else 0
+
+    # every entry starts remain-min_length+1 stems, of length min_length..remain
+    count = np.maximum(remain-min_length+1, 0)
+    start = np.repeat(np.arange(len(rows)), count)
+    offset = np.arange(len(start)) - np.repeat(np.cumsum(count)-count, count)
+    length = offset + min_length
+    stem_energy = prefix[run_pos[start]+length] - prefix[run_pos[start]]
+
+    stems_potential = np.column_stack(
+        [rows[start]+1, cols[start]+1, stem_energy, length]).tolist()
+    logging.debug(
+        f"{len(stems_potential)} potential stems for rna of length {len(rna_strand)}")
+    return [stems_potential, mu, rna_strand, len(rna_strand)]
+
+
+def prune_stems(stems_potential, min_length=3, max_loop=None, min_energy=None, top_k=None):
+    # indices of the stems to keep as QUBO variables, in their original order
+    # min_length: fewest base pairs of a stem
+    # max_loop: most unpaired bases enclosed by a stem, j-i+1-2*length
+    # min_energy: lowest stacking energy (third column) of a stem
+    # top_k: keep at most top_k stems with the highest stacking energy, the
+    #        earlier stem wins a tie
+    # None switches a cutoff off
+    stems = np.asarray(stems_potential, dtype=float)
+    if len(stems) == 0:
+        return np.zeros(0, dtype=np.int64)
+    energy = stems[:, 2]
+    length = stems[:, 3]
+    keep = length >= min_length
+    if max_loop is not None:
+        keep &= stems[:, 1] - stems[:, 0] + 1 - 2*length <= max_loop
+    if min_energy is not None:
+        keep &= energy >= min_energy
+    index = np.flatnonzero(keep)
+    if top_k is not None and len(index) > top_k:
+        best = np.argsort(-energy[index], kind='stable')[:top_k]
+        index = np.sort(index[best])
+    return index
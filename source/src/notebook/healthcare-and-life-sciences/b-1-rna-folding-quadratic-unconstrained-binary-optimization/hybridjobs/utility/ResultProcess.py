@@ -5,7 +5,6 @@
 #   The following class is for different kinds of annealing optimizer
 ########################################################################################################################
 from pickletools import optimize  # nosec
-import boto3
 import json
 import pickle  # nosec
 import os
@@ -13,20 +12,28 @@ from os.path import exists
 import datetime
 import logging
 import re
-import matplotlib.pyplot as plt
-import forgi.visual.mplotlib as fvm
-import forgi 
 import sys
 
 from .RNAParser import RNAData
 from .RNAGeoCalc import *
+from .ResultStore import load_result_arrays, head_samples
 
 # import py3Dmol
 import time
 # from ipywidgets import interact, fixed, IntSlider
 # import ipywidgets
 
-s3_client = boto3.client("s3")
+# created on first use, importing this module needs no AWS region or credentials
+s3_client = None
+
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client("s3")
+    return s3_client
+
 
 log = logging.getLogger()
 log.setLevel('INFO')
@@ -71,7 +78,7 @@ class ResultParser():
         # keep N recent results
         self.N = 100
         self.tried_combination = set()
-        if self.method == "dwave-sa" or self.method == "neal-sa":
+        if self.method == "dwave-sa" or self.method == "neal-sa" or self.method == "numpy-sa" or self.method == "numpy-pt":
             logging.info("parse simulated annealer result")
             self.result = None
         elif self.method == "dwave-qa":
@@ -87,11 +94,7 @@ class ResultParser():
     def generate_optimize_pts(self):
         logging.info("generate_optimize_pts()")
         # get best configuration
-        pddf_sample_result = self.raw_result["response"].aggregate(
-        ).to_pandas_dataframe()
-
-        pddf_head_sample = pddf_sample_result.sort_values(
-            by=['energy']).head(self.N)
+        pddf_head_sample = head_samples(self.raw_result["response"], self.N)
 
         evaluate_loop_result = False
         min_energy_score = sys.maxsize
@@ -415,16 +418,21 @@ class ResultParser():
         logging.info("_read_result_obj")
         key = f"{prefix}/{task_id}/{file_name}"
         logging.info(f"_read_result_obj: {key}")
-        obj = s3_client.get_object(Bucket=bucket, Key=key)
+        obj = get_s3_client().get_object(Bucket=bucket, Key=key)
         return obj
 
     def _load_raw_result(self):
         logging.info("_load_raw_result")
         if self.method != "dwave-qa":
             logging.info(f"load simulated annealer {self.method} raw result")
+            array_path = f"./{self.method}_result"
             full_path = f"./{self.method}_result.pickle"
-            with open(full_path, "rb") as f:
-                self.raw_result = pickle.load(f)  # nosec
+            # use the latest of the array result and the pickle fallback
+            if os.path.isdir(array_path) and (not os.path.exists(full_path) or os.path.getmtime(os.path.join(array_path, "result.json")) >= os.path.getmtime(full_path)):
+                self.raw_result = load_result_arrays(array_path)
+            else:
+                with open(full_path, "rb") as f:
+                    self.raw_result = pickle.load(f)  # nosec
         elif self.method == "dwave-qa":
             logging.info("load quantum annealer raw result")
             obj = self._read_result_obj(
@@ -486,7 +494,8 @@ class ResultParser():
         rna_name = self.rna_name
         stems_p = self.rna_data[rna_name]['potential_stems'][0]
         for j in range(0, len(stems_p)):
-            if candidate_result[str(j)] == 1:
+            # pruned stems are not variables of the model
+            if candidate_result.get(str(j), 0) == 1:
                 f_stems.append(stems_p[j])
         return f_stems
 
@@ -551,6 +560,10 @@ class ResultParser():
             
             f.close()
         
+        # notebook only dependencies, not needed in hybrid jobs
+        import matplotlib.pyplot as plt
+        import forgi.visual.mplotlib as fvm
+        import forgi
         bg = forgi.load_rna(file_name, allow_many=False)
 
         ax,_ = fvm.plot_rna(bg, text_kwargs={"fontweight":"black"}, lighten=0.7,
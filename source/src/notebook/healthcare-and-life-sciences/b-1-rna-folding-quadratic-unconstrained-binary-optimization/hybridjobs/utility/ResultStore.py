@@ -0,0 +1,95 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following functions are the columnar writer/reader of annealer results
+########################################################################################################################
+import dimod
+
+import numpy as np
+import pandas as pd
+import json
+import os
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+# a result directory holds
+#   samples.npy          (num_rows, ceil(num_variables/8)) uint8, np.packbits of the 0/1 samples
+#   energy.npy           (num_rows,) float
+#   num_occurrences.npy  (num_rows,) int
+#   result.json          labels, num_variables, time, model_info and the other result values
+# the npy files are opened with memory mapping. head_samples still reads the whole
+# packed sample matrix to aggregate duplicates (1 bit per variable), only the
+# N lowest energy rows are unpacked
+
+
+def save_result_arrays(result, path):
+    os.makedirs(path, exist_ok=True)
+    response = result["response"]
+    record = response.record
+    np.save(os.path.join(path, "samples.npy"),
+            np.packbits(record.sample.astype(bool), axis=1))
+    np.save(os.path.join(path, "energy.npy"),
+            np.asarray(record.energy, dtype=float))
+    np.save(os.path.join(path, "num_occurrences.npy"),
+            np.asarray(record.num_occurrences, dtype=np.int64))
+
+    meta = {}
+    meta["labels"] = list(response.variables)
+    meta["num_variables"] = len(response.variables)
+    meta["info"] = response.info
+    for key, value in result.items():
+        if key != "response":
+            meta[key] = value
+    with open(os.path.join(path, "result.json"), "w") as f:
+        json.dump(meta, f, default=str)
+    logging.info(f"finish save result arrays to {path}")
+    return path
+
+
+def load_result_arrays(path, mmap_mode='r'):
+    with open(os.path.join(path, "result.json"), "r") as f:
+        result = json.load(f)
+    response = {}
+    response["labels"] = result.pop("labels")
+    response["num_variables"] = result.pop("num_variables")
+    response["info"] = result.pop("info")
+    response["samples"] = np.load(os.path.join(
+        path, "samples.npy"), mmap_mode=mmap_mode)
+    response["energy"] = np.load(os.path.join(
+        path, "energy.npy"), mmap_mode=mmap_mode)
+    response["num_occurrences"] = np.load(os.path.join(
+        path, "num_occurrences.npy"), mmap_mode=mmap_mode)
+    result["response"] = response
+    return result
+
+
+def head_samples(response, N):
+    # the N lowest energy rows of the aggregated samples as a DataFrame,
+    # same rows and index as response.aggregate().to_pandas_dataframe().sort_values(by=['energy']).head(N)
+    if isinstance(response, dimod.SampleSet):
+        return response.aggregate().to_pandas_dataframe().sort_values(by=['energy']).head(N)
+
+    # aggregate duplicated samples, in order of their first occurrence
+    packed = np.asarray(response["samples"])
+    packed_view = np.ascontiguousarray(packed).view(
+        np.dtype((np.void, packed.shape[1]))).ravel()
+    _, first_row, inverse = np.unique(
+        packed_view, return_index=True, return_inverse=True)
+    order = np.argsort(first_row, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    agg_row = first_row[order]
+    agg_occurrences = np.bincount(rank[inverse.ravel()], weights=np.asarray(
+        response["num_occurrences"]), minlength=len(order)).astype(np.int64)
+    agg_energy = np.asarray(response["energy"])[agg_row]
+
+    head = np.argsort(agg_energy, kind='quicksort')[:N]
+    samples = np.unpackbits(packed[agg_row[head]], axis=1)[
+        :, :response["num_variables"]].astype(np.int8)
+    df = pd.DataFrame(samples, columns=response["labels"], index=head)
+    df["energy"] = agg_energy[head]
+    df["num_occurrences"] = agg_occurrences[head]
+    return df
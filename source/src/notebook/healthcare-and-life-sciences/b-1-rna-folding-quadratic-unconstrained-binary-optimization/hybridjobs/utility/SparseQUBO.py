@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the integer-indexed sparse representation of QUBO models
+########################################################################################################################
+import dimod
+
+import numpy as np
+from collections import defaultdict
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class SparseQUBO():
+    # labels: variable name of each integer index, e.g. ['x_1_1', 'x_1_2', ...]
+    # linear: coefficient of each variable, indexed by the integer index
+    # row/col/quad: COO arrays of the quadratic coefficients
+
+    def __init__(self, labels, linear, row, col, quad, offset=0.0):
+        self.labels = list(labels)
+        self.index = {label: idx for idx, label in enumerate(self.labels)}
+        self.linear = np.asarray(linear, dtype=float)
+        self.row = np.asarray(row, dtype=np.int64)
+        self.col = np.asarray(col, dtype=np.int64)
+        self.quad = np.asarray(quad, dtype=float)
+        self.offset = float(offset)
+
+    @property
+    def num_variables(self):
+        return len(self.labels)
+
+    @property
+    def num_interactions(self):
+        return len(self.quad)
+
+    @classmethod
+    def from_dict(cls, qubo, offset=0.0):
+        # {(u, v): bias} -> SparseQUBO, (u, u) keys are the linear terms
+        labels = []
+        index = {}
+
+        def _get_index(label):
+            if label not in index:
+                index[label] = len(labels)
+                labels.append(label)
+            return index[label]
+
+        linear_terms = []
+        row = []
+        col = []
+        quad = []
+        for (u, v), bias in qubo.items():
+            u_idx = _get_index(u)
+            v_idx = _get_index(v)
+            if u_idx == v_idx:
+                linear_terms.append((u_idx, bias))
+            else:
+                row.append(u_idx)
+                col.append(v_idx)
+                quad.append(bias)
+
+        linear = np.zeros(len(labels), dtype=float)
+        for idx, bias in linear_terms:
+            linear[idx] += bias
+
+        return cls(labels, linear, row, col, quad, offset)
+
+    @classmethod
+    def from_bqm(cls, bqm):
+        bqm = bqm.change_vartype(dimod.BINARY, inplace=False)
+        labels = list(bqm.variables)
+        linear, (row, col, quad), offset = bqm.to_numpy_vectors(
+            variable_order=labels)
+        return cls(labels, linear, row, col, quad, offset)
+
+    def to_dict(self):
+        # same layout as RNAQUBO._manual_qubo
+        qubo = defaultdict(float)
+        for idx, bias in enumerate(self.linear.tolist()):
+            label = self.labels[idx]
+            qubo[(label, label)] = bias
+        for u_idx, v_idx, bias in zip(self.row.tolist(), self.col.tolist(), self.quad.tolist()):
+            qubo[(self.labels[u_idx], self.labels[v_idx])] += bias
+        return qubo
+
+    def to_bqm(self):
+        return dimod.BinaryQuadraticModel.from_numpy_vectors(
+            self.linear, (self.row, self.col, self.quad), self.offset, dimod.BINARY, variable_order=self.labels)
+
+    def to_csr(self):
+        # upper triangular CSR arrays (indptr, indices, data) of the quadratic terms,
+        # duplicated (u, v)/(v, u) entries are summed
+        n = self.num_variables
+        row = np.minimum(self.row, self.col)
+        col = np.maximum(self.row, self.col)
+        key, inverse = np.unique(row * n + col, return_inverse=True)
+        data = np.zeros(len(key), dtype=float)
+        np.add.at(data, inverse, self.quad)
+        indices = key % n
+        indptr = np.searchsorted(key // n, np.arange(n + 1))
+        return indptr, indices, data
+
+    def to_dense(self):
+        # symmetric matrix with the linear terms on the diagonal,
+        # energy = x @ Q @ x for binary x
+        n = self.num_variables
+        dense = np.zeros((n, n), dtype=float)
+        np.add.at(dense, (self.row, self.col), self.quad / 2)
+        np.add.at(dense, (self.col, self.row), self.quad / 2)
+        dense[np.diag_indices(n)] += self.linear
+        return dense
+
+    def energies(self, samples):
+        # energy of each row of a (num_samples, num_variables) 0/1 array
+        samples = np.atleast_2d(np.asarray(samples, dtype=float))
+        return samples @ self.linear + np.sum(samples[:, self.row] * samples[:, self.col] * self.quad, axis=1) + self.offset
+
+    def describe(self):
+        logging.info(
+            f"sparse qubo with {self.num_variables} variables and {self.num_interactions} interactions")
+        return self.num_variables, self.num_interactions
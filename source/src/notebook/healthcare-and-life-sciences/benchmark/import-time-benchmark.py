@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following script benchmarks the import time of the hybrid job scripts
+########################################################################################################################
+# python import-time-benchmark.py [--threshold 1.5] [--repeat 3] [--top 10] [--allow-missing] [job.py ...]
+#
+# Every */hybridjobs/*.py job script is imported in a fresh interpreter with
+# python -X importtime (the script's main() is not run). The import time is
+# the best of --repeat runs, the heaviest top level imports are listed, and
+# the exit code is 1 when a script is slower than --threshold seconds or
+# fails to import (unless --allow-missing and the error is a missing module).
+
+import argparse
+import glob
+import os
+import subprocess  # nosec
+import sys
+
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+
+LOAD_SCRIPT = '''
+import importlib.util, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("hybrid_job", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print(f"import-seconds {time.perf_counter() - start}")
+'''
+
+
+def job_scripts():
+    scripts = glob.glob(os.path.join(__dir__, "..", "*", "hybridjobs", "*.py"))
+    return sorted(os.path.normpath(script) for script in scripts)
+
+
+def parse_importtime(stderr):
+    # top level modules (no indentation in the tree) and their cumulative us
+    top_level = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            top_level.append((int(cumulative), name.strip()))
+    return sorted(top_level, reverse=True)
+
+
+def measure(script):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", LOAD_SCRIPT, script],  # nosec
+                            cwd=os.path.dirname(script), capture_output=True, text=True)
+    seconds = None
+    for line in result.stdout.splitlines():
+        if line.startswith("import-seconds"):
+            seconds = float(line.split()[1])
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+    return seconds, parse_importtime(result.stderr), error
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scripts", nargs="*")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--allow-missing", action="store_true")
+    args = parser.parse_args()
+
+    fail = False
+    for script in args.scripts or job_scripts():
+        # measure() runs in the directory of the script
+        script = os.path.abspath(script)
+        name = os.path.relpath(script, os.path.join(__dir__, ".."))
+        runs = [measure(script) for _ in range(args.repeat)]
+        error = runs[0][2]
+        if error is not None:
+            missing = error.startswith("ModuleNotFoundError")
+            status = "missing" if missing and args.allow_missing else "FAIL"
+            fail = fail or status == "FAIL"
+            print(f"{status:<8}{name}: {error}")
+            continue
+
+        seconds, top_level, _ = min(runs, key=lambda run: run[0])
+        status = "ok" if seconds <= args.threshold else "FAIL"
+        fail = fail or status == "FAIL"
+        print(f"{status:<8}{name}: {seconds:.3f} s (threshold {args.threshold} s)")
+        for cumulative, module in top_level[:args.top]:
+            print(f"{'':<8}{cumulative/1e6:>8.3f} s  {module}")
+
+    sys.exit(1 if fail else 0)
+
+
+if __name__ == "__main__":
+    main()